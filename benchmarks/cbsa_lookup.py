@@ -0,0 +1,107 @@
+"""
+CBSA lookup benchmark: points per second of the legacy linear bounding-box scan against the
+CbsaIndex geo engine (grid prefilter + exact polygon test), single and batch lookups.
+
+    python -m benchmarks.cbsa_lookup                      # synthetic overlapping CBSAs
+    python -m benchmarks.cbsa_lookup --data ./data        # real cbsa_bounding_boxes.json (+ cbsa_polygons.json)
+"""
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+from common.CbsaIndex import CbsaIndex
+from common.JSONMixin import JSONMixin
+
+
+def legacy_find_cbsa(cbsa_data, latitude, longitude):
+    # the scan done by find_cbsa before the index, without its per call file read
+    for cbsa in cbsa_data:
+        if (cbsa['min_lat'] <= float(latitude) <= cbsa['max_lat'] and
+                cbsa['min_lon'] <= float(longitude) <= cbsa['max_lon']):
+            return cbsa
+    return None
+
+
+def synthetic_data(folder, count, vertices, seed):
+    """
+    Writes overlapping CBSAs: an irregular polygon per CBSA and its bounding box
+    """
+    rnd = random.Random(seed)
+    boxes, features = [], []
+    for i in range(count):
+        center_lat, center_lon = rnd.uniform(25, 48), rnd.uniform(-124, -68)
+        radius = rnd.uniform(0.2, 1.5)
+        ring = []
+        for v in range(vertices):
+            angle = 2 * math.pi * v / vertices
+            r = radius * rnd.uniform(0.6, 1.0)
+            ring.append([center_lon + r * math.cos(angle), center_lat + r * math.sin(angle)])
+        ring.append(ring[0])
+        geoid = f"{10000 + i}"
+        boxes.append({
+            'CBSAFP': geoid, 'GEOID': geoid, 'CSAFP': str(i % 150),
+            'min_lat': min(p[1] for p in ring), 'max_lat': max(p[1] for p in ring),
+            'min_lon': min(p[0] for p in ring), 'max_lon': max(p[0] for p in ring),
+        })
+        features.append({'type': 'Feature', 'properties': {'GEOID': geoid},
+                         'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+
+    with open(os.path.join(folder, "cbsa_bounding_boxes.json"), 'w') as file:
+        json.dump(boxes, file)
+    with open(os.path.join(folder, "cbsa_polygons.json"), 'w') as file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, file)
+
+
+def measure(name, points, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    rate = points / elapsed if elapsed else float('inf')
+    print(f"{name:<34}{points:>10}{elapsed:>12.3f}{rate:>16,.0f}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="folder with cbsa_bounding_boxes.json, synthetic data when omitted")
+    parser.add_argument("--cbsa", type=int, default=935, help="synthetic CBSA count")
+    parser.add_argument("--vertices", type=int, default=200, help="synthetic polygon vertices")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    folder = args.data or tempfile.mkdtemp(prefix="cbsa_bench_")
+    if not args.data:
+        synthetic_data(folder, args.cbsa, args.vertices, args.seed)
+    cbsa_path_json = os.path.join(folder, "cbsa_bounding_boxes.json")
+
+    cbsa_data = JSONMixin.read_from_json_file(cbsa_path_json)
+    rnd = random.Random(args.seed + 1)
+    lats = [rnd.uniform(24, 49) for _ in range(args.points)]
+    lons = [rnd.uniform(-125, -67) for _ in range(args.points)]
+
+    start = time.perf_counter()
+    index = CbsaIndex.get(cbsa_path_json)
+    print(f"index build: {time.perf_counter() - start:.3f}s, cbsa: {len(cbsa_data)}, "
+          f"polygons: {sum(edges is not None for edges in index.polygons)}")
+    print(f"{'':<34}{'points':>10}{'seconds':>12}{'points/sec':>16}")
+
+    legacy = measure("legacy linear scan", args.points,
+                     lambda: [legacy_find_cbsa(cbsa_data, lat, lon) for lat, lon in zip(lats, lons)])
+    single = measure("CbsaIndex.lookup", args.points,
+                     lambda: [index.lookup(lat, lon) for lat, lon in zip(lats, lons)])
+    batch = measure("CbsaIndex.lookup_many", args.points, lambda: index.lookup_many(lats, lons))
+
+    # the batch and single paths must agree point by point
+    mismatches = sum(1 for lat, lon, cbsa in zip(lats, lons, index.lookup_many(lats, lons))
+                     if cbsa is not index.lookup(lat, lon))
+    print(f"single/batch mismatches: {mismatches}")
+    print(f"speedup vs legacy: lookup {single / legacy:.1f}x, lookup_many {batch / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+End to end pipeline benchmark: runs location -> cbsa -> menu -> make.csv for Imtiaz through
+lambda_handler against the local stub server (benchmarks/stub_server.py) and reports
+stores/sec, requests/sec, p50/p99 request latency and peak RSS.
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --latency-ms 80 --jitter-ms 40 --error-rate 0.02 --rate-limit 4
+    python -m benchmarks.pipeline --json     # machine readable summary
+
+Every run works on a fresh temporary data folder seeded with imtiaz/data/in, the stub server runs
+in its own process so the peak RSS is the one of the pipeline.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from common.APIMixin import APIMixin
+from common.ActionName import ActionName
+from common.LocalUtils import LocalUtils
+from common.ParserName import ParserName
+from common.ShardStore import ShardStore
+from lambda_function import lambda_handler
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def start_stub_server(args):
+    command = [sys.executable, "-m", "benchmarks.stub_server", "--port", "0",
+               "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+               "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+    process = subprocess.Popen(command, cwd=ROOT_PATH, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if "http://" not in line:
+        process.kill()
+        raise RuntimeError(f"Stub server did not start: {line}")
+    return process, line[line.index("http://"):].strip()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@contextlib.contextmanager
+def quiet_output():
+    """
+    Silences stdout/stderr at the file descriptor level, so the make.csv worker processes are quiet too
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved:
+            os.close(fd)
+
+
+def run_pipeline(overrides, verbose=False, max_steps=10000):
+    """
+    Follows the events returned by lambda_handler from PROCESS_LOCATION until the chain stops,
+    returns the seconds spent per action
+    """
+    event = {
+        "parser": ParserName.imtiaz.name,
+        "action": ActionName.PROCESS_LOCATION.value,
+        "use_proxy": False,
+        "page_size": overrides.pop("page_size"),
+        "offset": 0,
+        "has_more": True,
+    }
+    stage_times = {}
+    for _ in range(max_steps):
+        event.update(overrides)
+        action = event["action"]
+        start = time.perf_counter()
+        with contextlib.nullcontext() if verbose else quiet_output():
+            event = lambda_handler(event, None)
+        stage_times[action] = stage_times.get(action, 0.0) + time.perf_counter() - start
+        if not event or not event.get("has_more") or event.get("action") in (None, "None"):
+            break
+    return stage_times
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--latency-ms", type=float, default=50, help="stub latency per request")
+    arg_parser.add_argument("--jitter-ms", type=float, default=20, help="+/- random stub latency")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests failing with 503")
+    arg_parser.add_argument("--seed", type=int, default=7)
+    arg_parser.add_argument("--rate-limit", type=float, default=0, help="requests/sec against the stub, 0 unlimited")
+    arg_parser.add_argument("--page-size", type=int, default=500)
+    arg_parser.add_argument("--crawl-concurrency", type=int, default=4)
+    arg_parser.add_argument("--menu-encoding", choices=["gzip", "zstd"], default=None, help="compress written menus")
+    arg_parser.add_argument("--artifact-format", choices=["files", "shards"], default="files",
+                            help="one menu file per store or packed menu shards")
+    arg_parser.add_argument("--output-format", choices=["csv", "parquet", "arrow"], default="csv",
+                            help="format of the make.csv result files")
+    arg_parser.add_argument("--local-processes", type=int, default=1, help="make.csv worker processes")
+    arg_parser.add_argument("--json-stream", action="store_true", help="parse menu products incrementally in make.csv")
+    arg_parser.add_argument("--keep", action="store_true", help="keep the temporary data folder")
+    arg_parser.add_argument("--verbose", action="store_true", help="show the pipeline logs")
+    arg_parser.add_argument("--json", action="store_true", help="print the summary as json")
+    args = arg_parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    data_path = tempfile.mkdtemp(prefix="imtiaz_bench_")
+    shutil.copytree(os.path.join(ROOT_PATH, "imtiaz", "data", "in"), os.path.join(data_path, "in"))
+    server, base_url = start_stub_server(args)
+    try:
+        overrides = {
+            "base_url": base_url,
+            "data_path": data_path,
+            "cbsa_path": os.path.join(FIXTURES_PATH, "cbsa"),
+            "rate_limit": args.rate_limit,
+            "backoff_factor": 0.05,
+            "page_size": args.page_size,
+            "crawl_concurrency": args.crawl_concurrency,
+            "location_concurrency": args.crawl_concurrency,
+            "menu_encoding": args.menu_encoding,
+            "artifact_format": args.artifact_format,
+            "json_stream": args.json_stream,
+            "output_format": args.output_format,
+            "local_processes": args.local_processes,
+        }
+        APIMixin.request_log(reset=True)
+        start = time.perf_counter()
+        stage_times = run_pipeline(overrides, args.verbose)
+        elapsed = time.perf_counter() - start
+
+        with urllib.request.urlopen(f"{base_url}/stats") as response:
+            served = json.loads(response.read())
+    finally:
+        server.terminate()
+        server.wait()
+
+    requests_log = APIMixin.request_log()
+    latencies_ms = [seconds * 1000 for host, status, seconds in requests_log]
+    if args.artifact_format == "shards":
+        stores = ShardStore(LocalUtils(data_path), "menu-shards").load_index()
+    else:
+        menu_path = os.path.join(data_path, "menu")
+        stores = len([f for f in os.listdir(menu_path) if f.endswith(".json")]) if os.path.isdir(menu_path) else 0
+    summary = {
+        "stores": stores,
+        "requests": len(requests_log),
+        "failed_requests": sum(1 for host, status, seconds in requests_log if status != 200),
+        "elapsed_sec": round(elapsed, 3),
+        "stores_per_sec": round(stores / elapsed, 2) if elapsed else 0.0,
+        "requests_per_sec": round(len(requests_log) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies_ms, 0.50), 2),
+        "latency_p99_ms": round(percentile(latencies_ms, 0.99), 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "stage_sec": {action: round(seconds, 3) for action, seconds in stage_times.items()},
+        "served": served,
+    }
+
+    if args.keep:
+        summary["data_path"] = data_path
+    else:
+        shutil.rmtree(data_path, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"stores: {summary['stores']}, requests: {summary['requests']} ({summary['failed_requests']} failed), "
+          f"elapsed: {summary['elapsed_sec']}s")
+    print(f"stores/sec: {summary['stores_per_sec']}, requests/sec: {summary['requests_per_sec']}")
+    print(f"latency p50: {summary['latency_p50_ms']}ms, p99: {summary['latency_p99_ms']}ms, "
+          f"peak RSS: {summary['peak_rss_mb']}MB")
+    for action, seconds in summary["stage_sec"].items():
+        print(f"  {action:<20} {seconds:>8.3f}s")
+    if args.keep:
+        print(f"data kept in: {data_path}")
+
+
+if __name__ == '__main__':
+    main()
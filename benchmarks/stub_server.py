@@ -0,0 +1,138 @@
+"""
+Local HTTP stub of the Imtiaz shop API serving recorded fixtures, so the crawl path can be
+benchmarked without hitting the live site. Latency and errors can be injected per request.
+
+    python -m benchmarks.stub_server --port 8765 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+
+Endpoints (parameters are read from the query string or the form body, like the parsers send them):
+    /api/geofence               fixtures/imtiaz/geofence.json
+    /api/menu-section           fixtures/imtiaz/menu-section.json
+    /api/sub-section            fixtures/imtiaz/sub-section.json, by sectionId
+    /api/items-by-subsection    fixtures/imtiaz/items-by-subsection.json, by sub_section_id
+    /stats                      requests served per endpoint
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "imtiaz")
+EMPTY_RESPONSE = {"status": 404, "msg": "not found", "data": []}
+
+
+class StubState:
+    """
+    Fixtures and injection settings shared by the handler threads
+    """
+    def __init__(self, fixtures_path=FIXTURES_PATH, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 error_status=503, seed=None):
+        self.fixtures = {}
+        for name in ("geofence", "menu-section", "sub-section", "items-by-subsection"):
+            with open(os.path.join(fixtures_path, f"{name}.json"), 'r') as file:
+                self.fixtures[name] = json.load(file)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def next_delay_and_error(self):
+        with self.lock:
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+        return delay, failed
+
+    def count(self, endpoint, failed):
+        with self.lock:
+            counts = self.counts.setdefault(endpoint, {"ok": 0, "error": 0})
+            counts["error" if failed else "ok"] += 1
+
+    def response_for(self, endpoint, params):
+        if endpoint == "sub-section":
+            return self.fixtures[endpoint].get(params.get("sectionId"), EMPTY_RESPONSE)
+        if endpoint == "items-by-subsection":
+            return self.fixtures[endpoint].get(params.get("sub_section_id"), EMPTY_RESPONSE)
+        return self.fixtures.get(endpoint)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            params.update(parse_qsl(self.rfile.read(length).decode('utf-8')))
+
+        if url.path == "/stats":
+            with self.state.lock:
+                return self.__send(200, json.dumps(self.state.counts).encode('utf-8'))
+
+        endpoint = url.path.rsplit("/", 1)[-1]
+        body = self.state.response_for(endpoint, params)
+        if body is None:
+            return self.__send(404, b'{"status": 404}')
+
+        delay, failed = self.state.next_delay_and_error()
+        if delay:
+            time.sleep(delay)
+        self.state.count(endpoint, failed)
+        if failed:
+            return self.__send(self.state.error_status, b'{"status": 503, "msg": "injected error"}')
+        self.__send(200, json.dumps(body).encode('utf-8'))
+
+    def __send(self, status, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=0, host="127.0.0.1", **settings):
+    """
+    Creates the stub server (port 0 picks a free port, see server.server_address)
+    """
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(**settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--fixtures", default=FIXTURES_PATH)
+    arg_parser.add_argument("--latency-ms", type=float, default=0)
+    arg_parser.add_argument("--jitter-ms", type=float, default=0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--error-status", type=int, default=503)
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    server = make_server(args.port, args.host, fixtures_path=args.fixtures, latency_ms=args.latency_ms,
+                         jitter_ms=args.jitter_ms, error_rate=args.error_rate, error_status=args.error_status,
+                         seed=args.seed)
+    print(f"Stub server listening on http://{server.server_address[0]}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
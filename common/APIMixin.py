@@ -1,24 +1,171 @@
+import random
+import threading
+import time
+from collections import deque
 from urllib.error import HTTPError
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+
+from common.RateLimiter import RateLimiter
+
+# status codes worth another attempt, everything else fails straight away
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+# (url host, status, seconds to response headers) of the latest request attempts of the process
+_request_log = deque(maxlen=100000)
+_request_log_lock = threading.Lock()
 
 
 class APIMixin:
+    # requests/sec per host: a number or a dict host -> rate, subclasses override it
+    rate_limit = 2
+
     def __init__(self, is_proxy):
         self.is_proxy_url = is_proxy
+        self.connect_timeout = 10
+        self.read_timeout = 60
+        self.max_retries = 3
+        self.backoff_factor = 0.5
+        self.max_backoff = 30
+        # upper bound of one call with all of its retries and backoff sleeps
+        self.max_call_sec = 90
+        self.rate_limiter = RateLimiter.from_config(self.default_rate_limit())
+
+    def configure_transport(self, event):
+        """
+        Optional transport settings from the event: connect_timeout, read_timeout (seconds),
+        max_retries, backoff_factor (seconds, doubled on every retry), max_call_sec (seconds for a
+        call and its retries), rate_limit (requests/sec, a number or a dict host -> rate) and rate_burst
+        """
+        self.connect_timeout = event.get("connect_timeout", self.connect_timeout)
+        self.read_timeout = event.get("read_timeout", self.read_timeout)
+        self.max_retries = event.get("max_retries", self.max_retries)
+        self.backoff_factor = event.get("backoff_factor", self.backoff_factor)
+        self.max_call_sec = event.get("max_call_sec", self.max_call_sec)
+        if "rate_limit" in event or "rate_burst" in event:
+            self.rate_limiter = RateLimiter.from_config(event.get("rate_limit", self.default_rate_limit()),
+                                                        event.get("rate_burst"))
+
+    def default_rate_limit(self):
+        """Override rate_limit (or this method) in subclass to allow a different request rate."""
+        return self.rate_limit
+
+    def get_remaining_time_sec(self):
+        """Override in subclass, None when the time left for the invocation is unknown."""
+        return None
+
+    @staticmethod
+    def get_session(pool_size=20):
+        """
+        Process wide session, keeps a keep-alive connection pool per host across calls and warm invocations
+        """
+        global _session
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size)
+                _session.mount("https://", adapter)
+                _session.mount("http://", adapter)
+        return _session
+
+    @staticmethod
+    def __record(url, status, start):
+        with _request_log_lock:
+            _request_log.append((urlparse(url).netloc, status, time.perf_counter() - start))
+
+    @staticmethod
+    def request_log(reset=False):
+        """
+        (host, status, seconds) of the latest request attempts of the process, status 0 for connection errors
+        """
+        with _request_log_lock:
+            entries = list(_request_log)
+            if reset:
+                _request_log.clear()
+        return entries
+
+    def __backoff(self, attempt, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # full jitter exponential backoff
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    def __call_deadline(self):
+        budget = self.max_call_sec
+        remaining = self.get_remaining_time_sec()
+        if remaining is not None:
+            # leave the invocation a few seconds to hand off
+            budget = min(budget, remaining - 5)
+        return time.monotonic() + max(1.0, budget)
+
+    @staticmethod
+    def __checked(response):
+        try:
+            response.raise_for_status()  # Raise an exception for HTTP errors
+        except requests.exceptions.HTTPError:
+            # the body is streamed, release the connection
+            response.close()
+            raise
+        return response
+
+    def __send(self, method, url, rate_key, retry=True, **kwargs):
+        """
+        Sends the request through the pooled session with timeouts. With retry, 429/5xx and
+        connection errors are retried with jittered exponential backoff as long as the call stays
+        within max_call_sec and the time left for the invocation. The body is streamed and
+        decompressed (gzip/deflate) by requests when it is read.
+        """
+        session = self.get_session()
+        deadline = self.__call_deadline()
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            waited = self.rate_limiter.acquire(rate_key)
+            if waited:
+                logging.debug('Rate limited %s, waited %.3fs', rate_key, waited)
+            read_timeout = max(1.0, min(self.read_timeout, deadline - time.monotonic()))
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=(self.connect_timeout, read_timeout),
+                                           stream=True, **kwargs)
+                self.__record(rate_key, response.status_code, start)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.__record(rate_key, 0, start)
+                error = e
+
+            if error is None and response.status_code not in RETRY_STATUS:
+                return self.__checked(response)
+            delay = self.__backoff(attempt, response)
+            if not retry or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                return self.__checked(response)
+            if response is not None:
+                response.close()
+
+            attempt += 1
+            logging.info('Retrying %s in %.2fs, attempt %s/%s', url, delay, attempt, self.max_retries)
+            time.sleep(delay)
+
     def get_request(self, url, headers, payload,verify=True):
         # print("url to hit =>",url)
+        # rate limit against the upstream host, also when going through the proxy
+        rate_key = url
         if self.is_proxy_url:
             url = self.get_proxy_url(url)
         else:
             url = url
 
         try:
-            response = requests.get(url, headers=headers, data=payload,verify=verify)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            return response
+            return self.__send("GET", url, rate_key, headers=headers, data=payload, verify=verify)
         except requests.exceptions.RequestException as e:
             logging.error('Unable to fetch %s: %s', url, e)
             return None
@@ -26,26 +173,15 @@ class APIMixin:
             logging.error('Unable to fetch %s: %s', url, he)
             return None
 
-    def post_request(self, url, headers, json, data=None):
-
+    def post_request(self, url, headers, json, data=None, retry=False):
+        """
+        POSTs are not idempotent and are sent once, retry=True only for endpoints that are safe to replay
+        """
         try:
             if data is None:
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    json=json,
-                    timeout=60
-                )
+                return self.__send("POST", url, url, retry, headers=headers, json=json)
             else:
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    data=data,
-                    timeout=60
-                )
-
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            return response
+                return self.__send("POST", url, url, retry, headers=headers, data=data)
         except requests.exceptions.RequestException as e:
             logging.error('Unable to fetch %s: %s', url, e)
             return None
@@ -3,6 +3,7 @@ from enum import Enum
 
 class ActionName(Enum):
     PROCESS_LOCATION = "process.location"
+    PROCESS_CBSA = "process.cbsa"
     PROCESS_MENU = "process.menu"
     PROCESS_POST_MENU = "process.post.menu"
     MAKE_CSV = "make.csv"
@@ -1,39 +1,54 @@
 import csv
 import logging
+import multiprocessing
 import os
-import re
 import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from io import StringIO
-
-import boto3
 
 from common.ActionName import ActionName
+from common.CbsaIndex import CbsaIndex
+from common.ColumnarWriter import ColumnarWriter
+from common.GeocodeCache import GeocodeCache
+from common.Geocoder import Geocoder
 from common.JSONMixin import JSONMixin
 from common.LocalUtils import LocalUtils
 from common.ParserName import ParserName
+from common.Prefetcher import Prefetcher
+from common.ShardStore import ShardStore
+from common.StoreContext import StoreContext
+from common.TextNormalizer import TextNormalizer
+from common.ReferenceData import ReferenceData
 from common.S3Utils import S3Utils
 from common.Utils import Utils
 
 
 class BaseJsonToCsv(JSONMixin):
+    # columns of csv_headers() that come from the product, the others from the store
+    item_columns = ('menu_id', 'menu_parent_id', 'menu_parent_name', 'menu_name', 'menu_name_clean',
+                    'menu_description', 'price')
+
     def __init__(self, event, parser_path, context):
         super().__init__()
+        # kept to rebuild the parser in the worker processes of the local multi-process mode
+        self.event = event
         self.running_in_lambda = False
-        self.local_data_path = parser_path + "/data"
+        self.local_data_path = event.get("data_path", parser_path + "/data")
         self.input_file_path = "menu"
+        self.menu_shards_path = "menu-shards"
         self.cost_file_path = "post-menu-cost"
         self.output_file_path = "result"
-        self.cbsa_path = parser_path + "/../data"
+        self.cbsa_path = event.get("cbsa_path", parser_path + "/../data")
         self.address_file_name  = f"{self.get_service_name()}_address_cache.csv"
         self.context = context
-        self.cbsa_path_json = parser_path+"/../data/cbsa_bounding_boxes.json"
+        self.cbsa_path_json = os.path.join(self.cbsa_path, "cbsa_bounding_boxes.json")
 
         self.cbsa_map = {}
         self.offset = 0
         self.page_size = 500
         self.offset_end = -1
-        self.address_cache_updated = False
         self.log_id = ""
 
         if "offset" in event:
@@ -42,6 +57,20 @@ class BaseJsonToCsv(JSONMixin):
         if "offset_end" in event:
             self.offset_end = event["offset_end"]
 
+        self.geocode_batch_size = event.get("geocode_batch_size", 20)
+        self.prefetch_workers = event.get("prefetch_workers", 8)
+        self.prefetch_window = event.get("prefetch_window", 32)
+        # parse the products of a menu while they are written instead of loading the whole document first
+        self.json_stream = event.get("json_stream", False)
+        # "csv", or typed columnar files: "parquet" / "arrow" (needs pyarrow)
+        self.output_format = event.get("output_format", "csv")
+        if self.output_format != "csv":
+            ColumnarWriter.check(self.output_format)
+        # local runs only: the page is split across this many processes, each writing a part file
+        self.local_processes = event.get("local_processes", 1)
+        geocode_workers = event.get("geocode_workers", 4)
+        geocode_rate = event.get("geocode_rate", 10)
+
         # Instantiate S3Utils or LocalUtils
         if "AWS_LAMBDA_FUNCTION_VERSION" in os.environ:
             print("in Lambda")
@@ -49,6 +78,7 @@ class BaseJsonToCsv(JSONMixin):
             self.date_str = Utils(event).get_directory_name()
             self.version = self.date_str
             self.input_file_path = f"menu/{self.date_str}/{self.get_service_name()}"
+            self.menu_shards_path = f"menu-shards/{self.date_str}/{self.get_service_name()}"
             self.cost_file_path = f"post-menu-cost/{self.date_str}/{self.get_service_name()}"
             self.output_file_path = f"result/{self.date_str}/{self.get_service_name()}"
             self.address_file_path  = "lat-long-cache"
@@ -65,6 +95,21 @@ class BaseJsonToCsv(JSONMixin):
             self.local_utils = LocalUtils(self.local_data_path)
             self.file_utils = self.local_utils
 
+        # every worker writes its own delta shard of the address cache, see GeocodeCache
+        worker_id = f"{self.offset}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        if self.running_in_lambda:
+            self.geocode_cache = GeocodeCache(self.file_utils, self.address_file_path, self.address_file_name, worker_id)
+        else:
+            self.geocode_cache = GeocodeCache(self.local_utils, "", self.address_file_name, worker_id)
+        self.geocoder = Geocoder(self.geocode_cache, self.geocode_client(), max_workers=geocode_workers,
+                                 rate_per_sec=geocode_rate)
+
+        # menus written by gen_menu as JSONL shards (artifact_format "shards") instead of one file per store
+        self.artifact_format = event.get("artifact_format", "files")
+        self.menu_shards = None
+        if self.artifact_format == "shards":
+            self.menu_shards = ShardStore(self.file_utils, self.menu_shards_path)
+
         self.read_cbsa_text()
         self.brand_map = {
             ParserName.rc.name: 1, ParserName.daves.name: 2, ParserName.zaxbys.name: 3,
@@ -93,15 +138,23 @@ class BaseJsonToCsv(JSONMixin):
         }
 
     def parse_menu_csv(self):
-        all_files = self.file_utils.list(self.input_file_path+"/")
+        if self.menu_shards is not None:
+            self.menu_shards.load_index()
+            all_files = self.menu_shards.ids()
+        else:
+            all_files = self.file_utils.list(self.input_file_path+"/")
         total_records = len(all_files)
-        self.offset_end = total_records + 1
-        row_parsed = 0
+        # a fanned out worker converts [offset, offset_end), -1 (or past the end) runs to the last menu
+        if self.offset_end == -1:
+            self.offset_end = total_records + 1
+        range_end = min(self.offset_end, total_records)
         all_parsed = False
-        temp_file_name = f"{self.get_service_name()}_prices_{self.offset}.csv"
+        suffix = ".csv" if self.output_format == "csv" else ColumnarWriter.suffixes[self.output_format]
+        temp_file_name = f"{self.get_service_name()}_prices_{self.offset}{suffix}"
         key = os.path.join(self.local_data_path, self.output_file_path, temp_file_name)
 
         if self.running_in_lambda:
+            # menus are streamed from S3, /tmp only holds the csv parts of earlier warm invocations
             self.delete_all_contents(self.local_data_path)
 
         fieldnames = self.csv_headers()
@@ -111,41 +164,20 @@ class BaseJsonToCsv(JSONMixin):
             pass
         os.makedirs(os.path.dirname(key), exist_ok=True)
 
-        with open(key, 'a', newline='', encoding='utf-8') as csv_out_file:
-            writer = csv.DictWriter(csv_out_file, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for f_name in all_files:
-                if row_parsed >= self.offset:
-                    if self.running_in_lambda:
-                        self.file_utils.download_object(f_name,
-                                                        os.path.join(self.local_data_path, f_name))
-                    try:
-                        # remove menu due to error
-                        # No such file or directory: '/tmp/menu/post-menu/2025039/hardees/132632.json'
-                        item_details_json = self.read_from_json_file(os.path.join(self.local_data_path,f_name))
-                        item_id = f_name.split(".")[0]
-                        if item_details_json is not None:
-                            self.write_menu_to_csv(item_details_json, item_id, writer)
-                        else:
-                            logging.error('Data was not inputted for %s', item_id)
-                    except Exception as e:
-                        logging.error(
-                            'Data was not inputted for %s because of Error: %s', f_name, e)
-                row_parsed += 1
-
-                if row_parsed >= self.offset + self.page_size:
-                    logging.info(f"[{self.get_service_name()}] Menu parsed: {row_parsed}/{total_records}")
-                    break
+        row_parsed = min(self.offset, total_records)
+        page_end = min(self.offset + self.page_size, range_end)
+        files = all_files[row_parsed:page_end]
+        if self.local_processes > 1 and not self.running_in_lambda and len(files) > 1:
+            row_parsed += self.__write_menus_parallel(files, key)
+        else:
+            with self.__open_writer(key, fieldnames) as writer:
+                row_parsed += self.__write_menus(files, writer)
 
-                if self.get_remaining_time_sec() < 70:
-                    logging.info(
-                        f"[{self.get_service_name()}] Function is suspended because of possible timeout: {row_parsed}/{total_records}")
-                    # self.page_size = self.offset - row_parsed
-                    break
+        if row_parsed < range_end:
+            logging.info(f"[{self.get_service_name()}] Menu parsed: {row_parsed}/{total_records}")
 
-        if row_parsed >= total_records:
-            logging.info(f"[{self.get_service_name()}] All menu items are parsed, Total record: {total_records}")
+        if row_parsed >= range_end:
+            logging.info(f"[{self.get_service_name()}] All menu items between ({self.offset}, {range_end}) are parsed, Total record: {total_records}")
             all_parsed = True
 
         # Upload final CSV to S3
@@ -153,11 +185,12 @@ class BaseJsonToCsv(JSONMixin):
             print("Uploading to s3: " + str(os.path.join(self.output_file_path, temp_file_name)))
             self.file_utils.upload_object(key, os.path.join(self.output_file_path, temp_file_name))
 
-            if self.address_cache_updated:
-                local_path = os.path.join(self.local_data_path, self.address_file_name)
-                s3_cache_path = os.path.join(self.address_file_path, self.address_file_name)
-                logging.info(f"[{self.get_service_name()}] Uploading to S3: source:{local_path}, destination:{s3_cache_path}")
-                self.file_utils.upload_object(local_path, s3_cache_path)
+        # single write of every address geocoded during this page
+        self.geocode_cache.flush()
+        if all_parsed and range_end == total_records:
+            # the chain that converted the last menu folds the delta shards in, shards of workers
+            # still running on other ranges are left for the next compaction
+            self.geocode_cache.compact()
 
         percentage = str(round(row_parsed / total_records * 100, 2)) + "%"
 
@@ -184,8 +217,155 @@ class BaseJsonToCsv(JSONMixin):
                 "offset_end": self.offset_end,
                 "completed": percentage,
                 "version": self.version,
+                "artifact_format": self.artifact_format,
+                "json_stream": self.json_stream,
+                "output_format": self.output_format,
+                "local_processes": self.local_processes,
             }
 
+    def __write_menus(self, files, writer):
+        """
+        Writes the menus of files, returns how many were handled (fewer than all when running out of time)
+        """
+        parsed = 0
+        # menus of the page are downloaded ahead of parsing, window bounds the look-ahead
+        with Prefetcher(self.__read_menu_json, files, self.prefetch_workers, self.prefetch_window,
+                        self.__release_menu) as prefetcher:
+            # a small batch of menus at a time: geocode all of their stores at once, then write them
+            for menus in prefetcher.batches(self.geocode_batch_size):
+                self.prefetch_lat_long([menu.get('store') for f_name, menu in menus if isinstance(menu, dict)])
+
+                for f_name, item_details_json in menus:
+                    item_id = f_name.split(".")[0]
+                    try:
+                        if item_details_json is not None:
+                            self.write_menu_to_csv(item_details_json, item_id, writer)
+                        else:
+                            logging.error('Data was not inputted for %s', item_id)
+                    except Exception as e:
+                        logging.error(
+                            'Data was not inputted for %s because of Error: %s', f_name, e)
+                    finally:
+                        self.__release_menu(item_details_json)
+                parsed += len(menus)
+
+                if self.get_remaining_time_sec() < 70:
+                    logging.info(
+                        f"[{self.get_service_name()}] Function is suspended because of possible timeout: {parsed}/{len(files)}")
+                    break
+        return parsed
+
+    def __write_menus_parallel(self, files, key):
+        """
+        Splits files in contiguous slices, one per worker process. Every worker writes its slice to a
+        part file and its geocoded addresses to its own GeocodeCache delta shard (folded in by compact).
+        The parts are joined in slice order, so the result is the same as a single process run.
+        """
+        processes = min(self.local_processes, len(files))
+        size = -(-len(files) // processes)
+        slices = [files[start:start + size] for start in range(0, len(files), size)]
+        root, suffix = os.path.splitext(key)
+        part_keys = [f"{root}.part{index:03d}{suffix}" for index in range(len(slices))]
+
+        # the workers share the geocoding rate limit of a single process
+        event = dict(self.event, local_processes=1,
+                     geocode_rate=self.event.get("geocode_rate", 10) / len(slices))
+        logging.info(f"[{self.get_service_name()}] Writing {len(files)} menus with {len(slices)} processes")
+        # spawn: a forked child would inherit the locks of the prefetch and geocoding threads
+        with ProcessPoolExecutor(max_workers=len(slices), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(_write_menu_part, type(self), event, files_slice, part_key)
+                       for files_slice, part_key in zip(slices, part_keys)]
+            parsed = [future.result() for future in futures]
+
+        if self.output_format == "csv":
+            with open(key, 'w', newline='', encoding='utf-8') as csv_out_file:
+                for index, part_key in enumerate(part_keys):
+                    with open(part_key, newline='', encoding='utf-8') as part_file:
+                        header = part_file.readline()
+                        if index == 0:
+                            csv_out_file.write(header)
+                        shutil.copyfileobj(part_file, csv_out_file)
+        else:
+            ColumnarWriter.concat(part_keys, key, self.output_format)
+        for part_key in part_keys:
+            os.remove(part_key)
+        return sum(parsed)
+
+    def _write_part(self, files, key):
+        """
+        Worker side of __write_menus_parallel
+        """
+        if self.menu_shards is not None:
+            self.menu_shards.load_index()
+        with self.__open_writer(key, self.csv_headers()) as writer:
+            parsed = self.__write_menus(files, writer)
+        self.geocode_cache.flush()
+        return parsed
+
+    @contextmanager
+    def __open_writer(self, key, fieldnames):
+        if self.output_format == "csv":
+            with open(key, 'a', newline='', encoding='utf-8') as csv_out_file:
+                # writerow takes gen_csv_row dicts, write_rows the tuples of gen_csv_rows
+                writer = csv.DictWriter(csv_out_file, fieldnames=fieldnames)
+                writer.writeheader()
+                yield writer
+            return
+        # the page becomes one row group, repeated store columns are dictionary encoded
+        with ColumnarWriter(key, fieldnames, self.csv_column_types(), ['brand', 'city', 'state', 'cbsa'],
+                            self.output_format) as writer:
+            yield writer
+
+    def __read_menu_json(self, f_name):
+        try:
+            if self.menu_shards is not None:
+                # the whole shard is read once and shared by its consecutive menus
+                return self.menu_shards.read_cached(f_name)
+            # S3 listing returns full keys, the menu is parsed straight from the object body
+            path = "" if self.running_in_lambda else self.input_file_path
+            if self.json_stream:
+                return self.__stream_menu(path, f_name)
+            return self.file_utils.read_json(path, f_name)
+        except Exception as e:
+            logging.error(
+                'Data was not inputted for %s because of Error: %s', f_name, e)
+        return None
+
+    def __stream_values(self, path, f_name):
+        with self.file_utils.open_object(path, f_name) as body:
+            yield from self.stream_items(body, "store", "menu_detail.data.item")
+
+    def __stream_products(self, f_name, values):
+        # parse errors past the store are read errors of the menu, not write errors
+        try:
+            for prefix, product in values:
+                yield product
+        except Exception as e:
+            logging.error(
+                'Data was not inputted for %s because of Error: %s', f_name, e)
+        finally:
+            values.close()
+
+    @staticmethod
+    def __release_menu(menu):
+        # a streamed menu holds its object body open until its products are exhausted or closed
+        products = menu.get('menu_detail', {}).get('data') if isinstance(menu, dict) else None
+        if hasattr(products, 'close'):
+            products.close()
+
+    def __stream_menu(self, path, f_name):
+        """
+        Menu with only the store parsed, menu_detail.data is a generator parsing the products one by
+        one from the object body in the same pass (the body stays open until it is exhausted)
+        """
+        values = self.__stream_values(path, f_name)
+        prefix, store = next(values, (None, None))
+        if prefix != "store":
+            # gen_menu writes the store first, anything else is parsed at once
+            values.close()
+            return self.file_utils.read_json(path, f_name)
+        return {"store": store, "menu_detail": {"data": self.__stream_products(f_name, values)}}
+
     def get_service_name(self):
         """Override in subclass to provide service name (e.g., 'daves', 'chickfila')."""
         raise NotImplementedError("Subclasses should implement this method")
@@ -195,6 +375,12 @@ class BaseJsonToCsv(JSONMixin):
                 'store_id', 'zip_code', 'city', 'state', 'address', 'lat', 'long', 'brand', 'brand_id', 'date',
                 'cbsa_id', 'cbsa', 'utcoffset']
 
+    def csv_column_types(self):
+        """
+        Types of the columnar output, the other columns are strings
+        """
+        return {'price': 'float64', 'lat': 'float64', 'long': 'float64', 'brand_id': 'int64'}
+
     def write_menu_to_csv(self, api_response, store_id, writer=None):
         raise NotImplementedError("Subclasses should implement this method")
 
@@ -215,38 +401,23 @@ class BaseJsonToCsv(JSONMixin):
                 print(f"Deleted directory: {item_path}")
 
     def read_cbsa_text(self):
-        list_items_csv = self.local_utils.read_file(self.cbsa_path, "cbsa_db.csv")
-        csv_reader = csv.DictReader(StringIO(list_items_csv))
-        rows_list = list(csv_reader)
-        for i, row in enumerate(rows_list):
-            self.cbsa_map[row['geo_id']] = row['name']
+        # shared per process, parsed only on the first (cold) invocation
+        self.cbsa_map = ReferenceData.cbsa_names(self.cbsa_path, "cbsa_db.csv")
 
 
     def clean_text_remove_special_characters(self, text):
-        if isinstance(text,str):
-            cleaned_name = re.sub(r"[™®]", "", text)
-            cleaned_name = cleaned_name.strip().lower()
-            return cleaned_name
+        return TextNormalizer.clean_name(text)
 
     def clean_text(self, text):
-        if isinstance(text, str):  # Check if it's a string to avoid errors
-            text = text.strip()  # Remove leading/trailing whitespace
-            text = text.replace('\n', ' ').replace('\r', ' ')  # Remove newlines
-            text = text.replace(',', ' ')  # Replace commas with spaces (or other suitable character)
-            # Optionally, you can remove extra spaces or special characters:
-            text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with a single space
-        return text
+        # memoized, the same names and descriptions repeat in every branch
+        return TextNormalizer.clean_text(text)
 
     def read_cost_files(self, api_response):
         cost_items = {}
         for file_path in api_response:
-            if self.running_in_lambda:
-                self.file_utils.download_object(os.path.join(self.cost_file_path, file_path),
-                                                os.path.join(self.local_data_path, self.cost_file_path, file_path))
             item_id = file_path.split(".")[0]
             try:
-                item_details_json = self.read_from_json_file(os.path.join(self.local_data_path,
-                                                                          self.cost_file_path, file_path))
+                item_details_json = self.file_utils.read_json(self.cost_file_path, file_path)
 
                 if item_details_json is not None:
                     cost_items[item_id] = self.find_cost(item_details_json["optiongroups"])
@@ -300,66 +471,57 @@ class BaseJsonToCsv(JSONMixin):
         return parse_options()
 
     # Fetches latitude and longitude from Amazon Location Service using the given address.
+    def geocode_client(self):
+        """
+        Override to geocode through another client exposing search_place_index_for_text (e.g. a
+        local stub), None uses the process wide Amazon Location client.
+        """
+        return None
+
     def fetch_location_api(self, address):
         """
         Fetches latitude and longitude from Amazon Location Service using the given address.
         """
-        client = boto3.client('location')
-        try:
-            response = client.search_place_index_for_text(
-                IndexName='Address2Location',
-                Text=address
-            )
-            if response['Results']:
-                coordinates = response['Results'][0]['Place']['Geometry']['Point']
-                # Amazon Location API returns coordinates as [longitude, latitude]
-                return coordinates[1], coordinates[0]
-        except Exception as e:
-            print(f"Error fetching lat/long for address '{address}': {e}")
-        return None, None
+        return self.geocoder.fetch(address)
 
-    def get_lat_long(self, address):
+    def store_address(self, store):
         """
-        Try address resolution through csv cache file
-        If the address file is unavailable or lacks specific entries,
-        call the service to fetch the required data,
-        update the file with the new entries, and save it back to S3.
+        Address used to geocode a store without coordinates, None when the store does not need geocoding
         """
-        local_path = os.path.join(self.local_data_path, self.address_file_name)
-        s3_cache_path = os.path.join(self.address_file_path, self.address_file_name)
-        try:
-            if self.running_in_lambda:
-                if (self.file_utils.file_exists(self.local_data_path, self.address_file_name) == False
-                        or self.file_utils.file_exists(self.address_file_path, self.address_file_name)):
-                    self.file_utils.download_object(s3_cache_path, local_path)
-
-            # Check the CSV file for existing latitude and longitude
-            with open(local_path, mode='r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if row['address'] == address:
-                        return row['lat'], row['long']
-        except FileNotFoundError:
-            print(f"CSV file '{local_path}' not found. It will be created.")
-
-        # If not found in the CSV, fetch from Amazon Location API
-        print(f"Fetching lat/long for address: {address}")
-        lat, long = self.fetch_location_api(address)
-        # todo: not thread safe implementation, move this logic from csv to dynamodb
-        self.address_cache_updated = True
+        latitude = store.get('latitude', 0.0)
+        longitude = store.get('longitude', 0.0)
+        address = store.get('address', 'N/A')
+        if latitude == 0.0 and longitude == 0.0 and address != 'N/A':
+            combined_address = ", ".join([address, store.get('city', 'N/A'), store.get('state', 'N/A'),
+                                          str(store.get('zipcode', 'N/A'))])
+            return combined_address.lower()
+        return None
 
-        if lat and long:
-            # Append the new address and its lat/long to the CSV file
-            with open(local_path, mode='a', newline='') as csvfile:
-                fieldnames = ['address', 'lat', 'long']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    def prefetch_lat_long(self, stores):
+        """
+        Geocode the distinct uncached addresses of a batch of stores concurrently,
+        gen_csv_row then resolves them from the cache
+        """
+        addresses = [self.store_address(store) for store in stores if isinstance(store, dict)]
+        addresses = [address for address in addresses if address is not None]
+        if addresses:
+            self.geocoder.resolve_many(addresses)
 
-                # Write header if file is empty
-                csvfile.seek(0, 2)  # Move to end of file to check size
-                if csvfile.tell() == 0:
-                    writer.writeheader()
+    def get_lat_long(self, address):
+        """
+        Try address resolution through the in-memory geocode cache
+        If the cache lacks the address, call the service to fetch the required data
+        and buffer the new entry, the cache is saved once at the end of parse_menu_csv.
+        """
+        cached = self.geocode_cache.get(address)
+        if cached is not None:
+            return cached
 
-                writer.writerow({'address': address, 'lat': lat, 'long': long})
+        # If not found in the cache, fetch from Amazon Location API
+        print(f"Fetching lat/long for address: {address}")
+        lat, long = self.fetch_location_api(address)
+        # buffered in memory, flushed once per page as a new delta shard of this worker (see GeocodeCache)
+        self.geocode_cache.put(address, lat, long)
 
         return lat, long
 
@@ -369,55 +531,110 @@ class BaseJsonToCsv(JSONMixin):
         # CSAFP represents a broader Combined Statistical Area that may contain multiple CBSAs.
         # GEOID is a more general geographic code that can be used for many types of regions (not just CBSAs).
 
-        cbsa_data = self.read_from_json_file(self.cbsa_path_json)
+        cbsa_index = CbsaIndex.get(self.cbsa_path_json)
         try:
-            for cbsa in cbsa_data:
-                if (cbsa['min_lat'] <= float(latitude) <= cbsa['max_lat'] and
-                        cbsa['min_lon'] <= float(longitude) <= cbsa['max_lon']):
-                    return cbsa
+            return cbsa_index.lookup(latitude, longitude)
         except Exception as e:
             logging.error(
                 f"[{self.get_service_name()}] Error: Unable to get CBSA")
 
         return None
 
-    def gen_csv_row(self, menu_name, menu_description, price, menu_id, menu_parent_id, menu_parent_name, store):
+    def store_context(self, store):
+        """
+        Store columns of the rows of a menu, geocoded from the cache filled by prefetch_lat_long
+        """
         cbsa_id = store.get('CBSAFP', 0)
         latitude = store.get('latitude', 0.0)
         longitude = store.get('longitude', 0.0)
-        address = store.get('address', 'N/A')
-        zipcode = str(store.get('zipcode', 'N/A'))
-        city = store.get('city', 'N/A')
-        state = store.get('state', 'N/A')
 
-        if latitude == 0.0 and longitude == 0.0 and address != 'N/A':
-            combined_address = ", ".join([address, city, state, zipcode])
-            latitude, longitude = self.get_lat_long(combined_address.lower())
+        combined_address = self.store_address(store)
+        if combined_address is not None:
+            latitude, longitude = self.get_lat_long(combined_address)
             cbsa= self.find_cbsa(latitude, longitude)
             if cbsa is not None:
                 cbsa_id=cbsa['CBSAFP']
 
-        cbsa_name = self.cbsa_map.get(cbsa_id, 'N/A')
-
-        return {
-            'menu_name': self.clean_text(menu_name),
-            'menu_name_clean': self.clean_text_remove_special_characters(menu_name),
-            'menu_description': self.clean_text(menu_description),
-            'price': price,
-            'menu_id': menu_id,
-            'menu_parent_id': menu_parent_id,
-            'menu_parent_name': self.clean_text(menu_parent_name),
+        values = {
             'store_id': store.get('store_id', 0),
-            'zip_code': zipcode,
-            'city': city,
-            'state': state,
-            'address': address,
+            'zip_code': str(store.get('zipcode', 'N/A')),
+            'city': store.get('city', 'N/A'),
+            'state': store.get('state', 'N/A'),
+            'address': store.get('address', 'N/A'),
             'lat': latitude,
             'long': longitude,
             'brand': self.brand_names_map.get(self.get_service_name()),
             'brand_id': self.brand_map.get(self.get_service_name()),
             'date': store.get('scrape_date', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
             'cbsa_id': cbsa_id,
-            'cbsa': cbsa_name,
+            'cbsa': self.cbsa_map.get(cbsa_id, 'N/A'),
             'utcoffset': store.get('utcoffset', 0)
         }
+        return StoreContext(values, self.csv_headers(), self.item_columns)
+
+    def gen_csv_rows(self, items, store_context):
+        """
+        Rows (tuples in csv_headers() order, for write_rows) of a store, one per
+        (menu_name, menu_description, price, menu_id, menu_parent_id, menu_parent_name) item,
+        an item that fails is logged and skipped
+        """
+        clean_text = self.clean_text
+        clean_text_remove_special_characters = self.clean_text_remove_special_characters
+        row_suffix = store_context.row_suffix
+        order = store_context.order
+        for menu_name, menu_description, price, menu_id, menu_parent_id, menu_parent_name in items:
+            try:
+                # item_columns order
+                row = (menu_id, menu_parent_id, clean_text(menu_parent_name), clean_text(menu_name),
+                       clean_text_remove_special_characters(menu_name), clean_text(menu_description),
+                       price) + row_suffix
+                if order is not None:
+                    row = order(row)
+            except Exception as e:
+                logging.error(f"[{self.get_service_name()}] Error processing product {menu_id}: {str(e)}")
+                continue
+            yield row
+
+    @staticmethod
+    def write_rows(writer, rows):
+        """
+        Writes the tuple rows of gen_csv_rows with writerows as they are produced, returns how many
+        were written
+        """
+        written = 0
+        if isinstance(writer, csv.DictWriter):
+            # the tuples are already in fieldnames order, skip the per row dict lookups
+            writer = writer.writer
+
+        def counted():
+            nonlocal written
+            for row in rows:
+                written += 1
+                yield row
+
+        writer.writerows(counted())
+        return written
+
+    def gen_csv_row(self, menu_name, menu_description, price, menu_id, menu_parent_id, menu_parent_name, store):
+        """
+        One row as a dict keyed by csv_headers(), for writer.writerow. Parsers writing whole menus
+        should prefer gen_csv_rows + write_rows, which compute the store columns once.
+        """
+        row = dict(self.store_context(store).values)
+        row.update({
+            'menu_name': self.clean_text(menu_name),
+            'menu_name_clean': self.clean_text_remove_special_characters(menu_name),
+            'menu_description': self.clean_text(menu_description),
+            'price': price,
+            'menu_id': menu_id,
+            'menu_parent_id': menu_parent_id,
+            'menu_parent_name': self.clean_text(menu_parent_name),
+        })
+        return row
+
+
+def _write_menu_part(parser_class, event, files, key):
+    """
+    Process pool entry point: rebuilds the parser from its event and writes one part of a page
+    """
+    return parser_class(event, None)._write_part(files, key)
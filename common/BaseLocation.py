@@ -1,11 +1,13 @@
+import asyncio
 import csv
 import logging
 import os
+import threading
 from datetime import datetime
 from io import StringIO
-from time import sleep
 
 from common.APIMixin import APIMixin
+from common.CrawlEngine import CrawlEngine
 from common.JSONMixin import JSONMixin
 from common.S3Utils import S3Utils
 from common.LocalUtils import LocalUtils
@@ -18,9 +20,11 @@ class BaseLocation(JSONMixin, APIMixin):
         self.debug_next_step = False
         self.use_proxy = event["use_proxy"]
         super().__init__(self.use_proxy)
+        self.configure_transport(event)
         self.running_in_lambda = False
         self.parser_folder = parser_path
-        self.local_data_path = parser_path + "/data"
+        # local runs can point the pipeline at another data folder (e.g. benchmarks)
+        self.local_data_path = event.get("data_path", parser_path + "/data")
         self.input_file_path = "in"
         self.output_file_path = "location"
         self.failed_items_path = "failed_loc"
@@ -31,8 +35,13 @@ class BaseLocation(JSONMixin, APIMixin):
         self.page_size = 1
         self.offset = 0
         self.append_log = []
+        self.append_log_lock = threading.Lock()
         self.context = context
 
+        # input rows and their pages are fetched concurrently, at most location_concurrency in flight
+        self.location_concurrency = event.get("location_concurrency", 4)
+        self.crawl_engine = CrawlEngine(self.location_concurrency)
+
         if "log_id" in event:
             self.log_id = event["log_id"]
         else:
@@ -89,39 +98,28 @@ class BaseLocation(JSONMixin, APIMixin):
     def gen_location(self):
         self.gen_location_preprocessor()
         last_id = self.offset
+        # one listing of the written locations, existence checks of the parsers are answered from it
+        self.file_utils.snapshot(self.output_file_path)
 
         list_items_csv = self.file_utils.read_file(self.input_file_path, self.location_csv_path)
         csv_reader = csv.DictReader(StringIO(list_items_csv))
         rows_list = list(csv_reader)
-        row_parsed = 0
         all_parsed = True
         total_records = len(rows_list)
 
         logging.info(f"[{self.get_service_name()}] Generating Locations, Total records:{total_records}")
 
-        for i, row in enumerate(rows_list):
-            parent_id = self.get_identifier_id(row)
-            offset = 0
-            total = 10  # set for max for initial run
-            size = self.url_page_size()
-
-            if row_parsed >= last_id:
-                # Read all record with help of pagination
-                while total > offset:
-                    if offset > 0:
-                        logging.info(f"[{self.get_service_name()}] waiting for 1 sec, record:{i}")
-                        sleep(1)
-                    logging.info(f"[{self.get_service_name()}] Fetching record, identity:{parent_id}, offset:{offset}, page_size:{size}")
-                    total = self.fetch_one_page(row, parent_id, size, offset)
-                    offset = offset + size
-
-            row_parsed += 1
-            if row_parsed > last_id + 1:  # sleep if multiple items
-                logging.info(f"[{self.get_service_name()}] waiting for 2 sec, record:{i}")
-                sleep(2)
-
-            if row_parsed >= last_id + self.page_size:
-                logging.info(f"[{self.get_service_name()}] Records parsed: {i}, Total record: {total_records}")
+        # rows of this invocation, processed in chunks so the timeout check still runs between them
+        row_parsed = min(last_id, total_records)
+        page_end = min(last_id + self.page_size, total_records)
+        chunk_size = max(1, self.location_concurrency)
+        while row_parsed < page_end:
+            chunk = rows_list[row_parsed:min(row_parsed + chunk_size, page_end)]
+            self.crawl_engine.run(self.__fetch_rows(chunk))
+            row_parsed += len(chunk)
+
+            if row_parsed >= page_end and row_parsed < total_records:
+                logging.info(f"[{self.get_service_name()}] Records parsed: {row_parsed}, Total record: {total_records}")
                 all_parsed = False
                 break
 
@@ -192,9 +190,35 @@ class BaseLocation(JSONMixin, APIMixin):
                 "log_file": self.log_file_path
             }
 
+    async def __fetch_rows(self, rows):
+        """
+        Fetches every page of the given input rows concurrently
+        """
+        await asyncio.gather(*(self.__fetch_row(row) for row in rows))
+
+    async def __fetch_row(self, row):
+        """
+        Reads all records of one input row with help of pagination: the first page gives the total,
+        the remaining offsets are then fetched concurrently (request pacing is done by the per host
+        rate limiter in APIMixin)
+        """
+        parent_id = self.get_identifier_id(row)
+        size = self.url_page_size()
+        host = self.get_service_name()
+
+        logging.info(f"[{self.get_service_name()}] Fetching record, identity:{parent_id}, offset:0, page_size:{size}")
+        total = await self.crawl_engine.fetch(host, self.fetch_one_page, row, parent_id, size, 0)
+        offsets = list(range(size, total or 0, size))
+        if offsets:
+            logging.info(f"[{self.get_service_name()}] Fetching record, identity:{parent_id}, pages:{len(offsets)}, total:{total}, page_size:{size}")
+            await self.crawl_engine.map(host, self.fetch_one_page,
+                                        [(row, parent_id, size, offset) for offset in offsets])
+
     def append_to_log(self, content):
+        # called from the fetch threads, log lines are independent of each other so only the list needs guarding
         content = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')},{ActionName.PROCESS_LOCATION.value},{self.log_id},{content}"
-        self.append_log.append(content)
+        with self.append_log_lock:
+            self.append_log.append(content)
 
     def flush_log(self):
         content = '\n'.join(self.append_log)
@@ -1,17 +1,19 @@
 import csv
-import json
 import logging
 import os
 from datetime import datetime
 from io import StringIO
-from time import sleep
 
 from common.APIMixin import APIMixin
 from common.ActionName import ActionName
+from common.CbsaIndex import CbsaIndex
+from common.CrawlEngine import CrawlEngine
 from common.JSONMixin import JSONMixin
 from common.LocalUtils import LocalUtils
 from common.ParserName import ParserName
+from common.ResponseCache import ResponseCache
 from common.S3Utils import S3Utils
+from common.ShardStore import ShardStore
 from common.Utils import Utils
 
 
@@ -19,15 +21,20 @@ class BaseMenu(JSONMixin, APIMixin):
     def __init__(self, event, parser_path, context):
         self.use_proxy = event["use_proxy"]
         super().__init__(self.use_proxy)
+        self.configure_transport(event)
         self.running_in_lambda = False
-        self.cbsa_path_json = parser_path+"/../data/cbsa_bounding_boxes.json"
+        self.cbsa_path_json = os.path.join(event.get("cbsa_path", parser_path + "/../data"), "cbsa_bounding_boxes.json")
 
-        self.local_data_path = parser_path + "/data"
+        # local runs can point the pipeline at another data folder (e.g. benchmarks)
+        self.local_data_path = event.get("data_path", parser_path + "/data")
         self.input_file_path = "location"
         self.output_file_path = "menu"
+        self.menu_shards_path = "menu-shards"
         self.failed_items_path = "failed_menu"
         self.status_path = "status"
         self.log_file = f"{self.get_service_name()}_menu.log"
+        self.cbsa_index_file = "cbsa_index.csv"
+        self.branch_menus_file = f"{self.get_service_name()}_branch_menus.csv"
         self.page_size = 1
         self.offset = 0
         self.append_log = []
@@ -39,6 +46,8 @@ class BaseMenu(JSONMixin, APIMixin):
             self.log_id = datetime.now().strftime("%Y%m%d%H%M%S")
         if "page_size" in event:
             self.page_size = event["page_size"]
+        # process.cbsa pages are cheap local lookups, not time boxed menu fetches
+        self.cbsa_page_size = event.get("cbsa_page_size", 5000)
 
         if "offset" in event:
             self.offset = event["offset"]
@@ -59,6 +68,15 @@ class BaseMenu(JSONMixin, APIMixin):
         if "goto_next_step" in event:
             self.goto_next_step = event["goto_next_step"]
 
+        # shared fan-out engine for multi level menu crawls, bounded per host
+        self.crawl_engine = CrawlEngine(event.get("crawl_concurrency", 4))
+        self.structure_cache_ttl = event.get("structure_cache_ttl", 6 * 3600)
+        # gzip/zstd compression of the written menus, readers detect it on their own
+        self.menu_encoding = event.get("menu_encoding")
+        # "shards" packs the menus into shared JSONL shards (see ShardStore) instead of one file per store
+        self.artifact_format = event.get("artifact_format", "files")
+        self.shard_size = event.get("shard_size", 100)
+
         # Instantiate S3Utils or LocalUtils
         if "AWS_LAMBDA_FUNCTION_VERSION" in os.environ:
             print("in Lambda")
@@ -68,6 +86,7 @@ class BaseMenu(JSONMixin, APIMixin):
             self.input_file_path = f"location/{self.date_str}/{self.get_service_name()}"
             self.failed_items_path = f"failed_menu/{self.date_str}/{self.get_service_name()}"
             self.output_file_path = f"menu/{self.date_str}/{self.get_service_name()}"
+            self.menu_shards_path = f"menu-shards/{self.date_str}/{self.get_service_name()}"
             self.status_path = f"status/{self.date_str}/{self.get_service_name()}"
             self.running_in_lambda = True
             self.file_utils = S3Utils(self.bucket_name)
@@ -84,6 +103,14 @@ class BaseMenu(JSONMixin, APIMixin):
             self.file_utils = self.local_utils
             self.log_file_path = os.path.join(self.file_utils.folder,self.status_path)
 
+        self.menu_shards = None
+        if self.artifact_format == "shards":
+            self.menu_shards = ShardStore(self.file_utils, self.menu_shards_path, self.shard_size)
+
+        # category trees and other structural responses shared by all stores of the run
+        self.response_cache = ResponseCache(self.file_utils, self.status_path,
+                                            f"{self.get_service_name()}_structure_cache.json", self.structure_cache_ttl)
+
     def get_service_name(self):
         """Override in subclass to provide service name (e.g., 'daves', 'chickfila')."""
         raise NotImplementedError("Subclasses should implement this method")
@@ -98,15 +125,80 @@ class BaseMenu(JSONMixin, APIMixin):
     def gen_request(self, params):
         raise NotImplementedError("Subclasses should implement this method")
 
-    def __read_location_json(self, filename):
-        if self.running_in_lambda:
-            if self.file_utils.file_exists(self.input_file_path, filename):
-                print("Downloading from s3: " + str(os.path.join(self.input_file_path, filename)))
-                self.file_utils.download_object(os.path.join(self.input_file_path, filename),
-                                                os.path.join(self.local_data_path, self.input_file_path, filename))
+    def get_fetch_key(self, store_data):
+        """
+        Override in subclass when several location files are served by the same menu request
+        (e.g. geofences of one branch), the menu is then fetched once per key. None disables it.
+        """
+        return None
 
-        item_details_json = self.read_from_json_file(os.path.join(
-            self.local_data_path, self.input_file_path, filename))
+    def read_branch_menus(self):
+        """
+        fetch key -> menu file already written for it, shared across the chained invocations of a run
+        """
+        self.branch_menus = {}
+        self.branch_menus_new = []
+        self.fetched_menus = {}
+        content = self.file_utils.read_segmented_file(self.status_path, self.branch_menus_file)
+        for row in csv.reader(StringIO(content)):
+            if len(row) == 3 and (row[2] == self.log_id or not self.force_fetch):
+                self.branch_menus.setdefault(row[0], row[1])
+
+    def flush_branch_menus(self):
+        if not self.branch_menus_new:
+            return
+        output = StringIO()
+        csv.writer(output, lineterminator="\n").writerows(self.branch_menus_new)
+        self.file_utils.append_to_file(self.status_path, self.branch_menus_file, output.getvalue().rstrip("\n"))
+        self.branch_menus_new = []
+
+    def __shared_menu_detail(self, fetch_key):
+        if fetch_key is None:
+            return None
+        fetch_key = str(fetch_key)
+        if fetch_key in self.fetched_menus:
+            return self.fetched_menus[fetch_key]
+
+        file_name = self.branch_menus.get(fetch_key)
+        if file_name is None:
+            return None
+        try:
+            menu_detail = self.read_menu_file(file_name)["menu_detail"]
+        except Exception as e:
+            logging.error(f"[{self.get_service_name()}] Unable to reuse menu {file_name} for fetch key:{fetch_key}: {e}")
+            return None
+        self.fetched_menus[fetch_key] = menu_detail
+        return menu_detail
+
+    def __remember_shared_menu(self, fetch_key, file_name, menu_detail):
+        if fetch_key is None:
+            return
+        fetch_key = str(fetch_key)
+        self.fetched_menus[fetch_key] = menu_detail
+        if fetch_key not in self.branch_menus:
+            self.branch_menus[fetch_key] = file_name
+            self.branch_menus_new.append([fetch_key, file_name, self.log_id])
+
+    def menu_file_exists(self, file_name):
+        if self.menu_shards is not None:
+            return file_name in self.menu_shards
+        return self.file_utils.file_exists(self.output_file_path, file_name)
+
+    def read_menu_file(self, file_name):
+        if self.menu_shards is not None:
+            return self.menu_shards.read(file_name)
+        return self.file_utils.read_json(self.output_file_path, file_name)
+
+    def write_menu_file(self, file_name, menu_data):
+        if self.menu_shards is not None:
+            self.menu_shards.add(file_name, menu_data)
+        else:
+            self.file_utils.write_file(self.output_file_path, file_name, self.json_dumps(menu_data),
+                                       encoding=self.menu_encoding)
+
+    def __read_location_json(self, filename):
+        # parsed straight from the S3 body (or the local file), nothing is staged in /tmp
+        item_details_json = self.file_utils.read_json(self.input_file_path, filename)
 
         return self.parse_location_for_menu(item_details_json, filename)
 
@@ -150,6 +242,14 @@ class BaseMenu(JSONMixin, APIMixin):
         list_items_csv = self.file_utils.read_file(self.status_path, "all_branches.csv")
         csv_reader = csv.DictReader(StringIO(list_items_csv))
         rows_list = list(csv_reader)
+        cbsa_lookup = self.read_cbsa_index()
+        self.read_branch_menus()
+        self.response_cache.load()
+        if self.menu_shards is not None:
+            self.menu_shards.load_index()
+        elif not self.force_fetch:
+            # one listing of the written menus instead of a HEAD request per store
+            self.file_utils.snapshot(self.output_file_path)
         row_parsed = 0
         all_parsed = False
         total_records = len(rows_list)
@@ -162,7 +262,10 @@ class BaseMenu(JSONMixin, APIMixin):
                 store_data = self.__read_location_json(j_filename)
                 store_data['scrape_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 # store_data_cbsa = self.attach_cbsa(store_data)
-                cbsa= self.find_cbsa(store_data['latitude'], store_data['longitude'])
+                if j_filename in cbsa_lookup:
+                    cbsa = cbsa_lookup[j_filename]
+                else:
+                    cbsa = self.find_cbsa(store_data['latitude'], store_data['longitude'])
                 if cbsa is not None:
                     store_data['CBSAFP']=cbsa['CBSAFP']
                     store_data['GEOID'] = cbsa['GEOID']
@@ -172,23 +275,34 @@ class BaseMenu(JSONMixin, APIMixin):
                     store_data['GEOID'] = '0'
                     store_data['CSAFP'] = '0'
 
-                if self.force_fetch or not self.file_utils.file_exists(self.output_file_path, j_filename):
-                    logging.info(f"[{self.get_service_name()}] Start: processing record:{i}, filename:{j_filename}")
-                    item_id, menu_details = self.gen_request(store_data)
-
-                    if not self.goto_next_step:
-                        logging.info(
-                            f"[{self.get_service_name()}][Menu] Function is suspended because of cookie expiration and zenRows API failure")
-                        break
-
-                    if menu_details:
-                        if self.get_service_name() == ParserName.popeyes.name:
-                            menu_data = {"store": store_data, "menu_detail": menu_details}
-                        elif self.get_service_name() == ParserName.solidcore.name:
-                            menu_data = {"store": store_data, "menu_detail": menu_details}
-                        else:
-                            menu_data = {"store": store_data, "menu_detail": menu_details.json()}
-                        self.file_utils.write_file(self.output_file_path, j_filename, json.dumps(menu_data))
+                if self.force_fetch or not self.menu_file_exists(j_filename):
+                    # stores sharing a fetch key (e.g. the same branch) are crawled only once
+                    fetch_key = self.get_fetch_key(store_data)
+                    menu_detail = self.__shared_menu_detail(fetch_key)
+                    if menu_detail is not None:
+                        item_id = fetch_key
+                        logging.info(f"[{self.get_service_name()}] Reusing menu of fetch key:{fetch_key}, record:{i}, filename:{j_filename}")
+                    else:
+                        logging.info(f"[{self.get_service_name()}] Start: processing record:{i}, filename:{j_filename}")
+                        item_id, menu_details = self.gen_request(store_data)
+
+                        if not self.goto_next_step:
+                            logging.info(
+                                f"[{self.get_service_name()}][Menu] Function is suspended because of cookie expiration and zenRows API failure")
+                            break
+
+                        if menu_details:
+                            if self.get_service_name() == ParserName.popeyes.name:
+                                menu_detail = menu_details
+                            elif self.get_service_name() == ParserName.solidcore.name:
+                                menu_detail = menu_details
+                            else:
+                                menu_detail = menu_details.json()
+
+                    if menu_detail is not None:
+                        menu_data = {"store": store_data, "menu_detail": menu_detail}
+                        self.write_menu_file(j_filename, menu_data)
+                        self.__remember_shared_menu(fetch_key, j_filename, menu_detail)
                         self.append_to_log(f"{self.log_id},url,{j_filename},{self.offset},success")
                         logging.info(
                             f"[{self.get_service_name()}] Success: processing record:{i}, store:{item_id}, filename:{j_filename}")
@@ -197,10 +311,6 @@ class BaseMenu(JSONMixin, APIMixin):
                         self.append_to_log(f"{self.log_id},url,{j_filename},{self.offset},failure")
                         logging.error(
                             f"[{self.get_service_name()}] Error: processing record:{i}, store:{item_id}, filename:{j_filename}")
-
-                    if row_parsed > self.offset + 1:  # sleep if multiple items
-                        logging.info(f"[{self.get_service_name()}] waiting for 2 sec, record:{i}")
-                        sleep(2)
                 else:
                     content = f"{self.log_id},file,{j_filename},found,success"
                     self.append_to_log(content)
@@ -226,7 +336,11 @@ class BaseMenu(JSONMixin, APIMixin):
             logging.info(f"[{self.get_service_name()}] All menu items are parsed, Total record: {total_records}")
             all_parsed = True
 
+        if self.menu_shards is not None:
+            self.menu_shards.flush()
         self.flush_log()
+        self.flush_branch_menus()
+        self.response_cache.save()
 
         percentage = str(round(row_parsed/total_records*100,2))+"%"
 
@@ -282,7 +396,8 @@ class BaseMenu(JSONMixin, APIMixin):
                 "version": self.version,
                 "log_id": self.log_id,
                 "log_file_path": self.log_file_path,
-                "previous_action": ActionName.PROCESS_MENU.value
+                "previous_action": ActionName.PROCESS_MENU.value,
+                "artifact_format": self.artifact_format
             }
         else:
             return {
@@ -297,9 +412,115 @@ class BaseMenu(JSONMixin, APIMixin):
                 "goto_next_step": self.goto_next_step,
                 "completed": percentage,
                 "version": self.version,
+                "log_id": self.log_id,
+                "artifact_format": self.artifact_format
+            }
+
+    def gen_cbsa_index(self):
+        """
+        Assign CBSA codes to the location files of the page [offset, offset + cbsa_page_size) in one
+        pass and add them to the side index (status/cbsa_index.csv), gen_menu then only has to look
+        the codes up. The first page rewrites the index, later pages append their rows as segments
+        that the last page folds in. Returns a PROCESS_CBSA continuation until every file is indexed.
+        """
+        # sorted, the offsets have to point at the same files in every invocation
+        all_files = sorted(f for f in self.file_utils.list(self.input_file_path) if f.endswith(".json"))
+        total_records = len(all_files)
+        row_parsed = min(self.offset, total_records)
+        page_end = min(self.offset + self.cbsa_page_size, total_records)
+        logging.info(f"[{self.get_service_name()}] Start: CBSA index ({row_parsed}, {page_end}), Total files found:{total_records}")
+
+        file_names, lats, lons = [], [], []
+        for j_filename in all_files[row_parsed:page_end]:
+            if self.get_remaining_time_sec() < 70:
+                logging.info(
+                    f"[{self.get_service_name()}][CBSA] Function is suspended because of possible timeout: {row_parsed}/{total_records}")
+                break
+            row_parsed += 1
+            try:
+                store_data = self.__read_location_json(j_filename)
+                file_names.append(j_filename)
+                lats.append(store_data.get('latitude'))
+                lons.append(store_data.get('longitude'))
+            except Exception as e:
+                logging.error(f"[{self.get_service_name()}] Error: Unable to read location {j_filename}: {e}")
+
+        cbsa_index = self.cbsa_index()
+        cbsa_list = cbsa_index.lookup_many(lats, lons) if cbsa_index is not None else [None] * len(file_names)
+        rows = []
+        for j_filename, cbsa in zip(file_names, cbsa_list):
+            if cbsa is not None:
+                rows.append({'file_name': j_filename, 'CBSAFP': cbsa['CBSAFP'],
+                             'GEOID': cbsa['GEOID'], 'CSAFP': cbsa['CSAFP']})
+            else:
+                rows.append({'file_name': j_filename, 'CBSAFP': '0', 'GEOID': '0', 'CSAFP': '0'})
+        matched = sum(1 for cbsa in cbsa_list if cbsa is not None)
+
+        output = StringIO()
+        writer = csv.DictWriter(output, fieldnames=self.cbsa_index_headers(), lineterminator="\n")
+        if self.offset == 0:
+            # segments left by an unfinished earlier run are folded in first, then overwritten
+            self.file_utils.compact_segments(self.status_path, self.cbsa_index_file)
+            writer.writeheader()
+            writer.writerows(rows)
+            self.file_utils.write_file(self.status_path, self.cbsa_index_file, output.getvalue())
+        elif rows:
+            # no read-modify-write of the index, a page that runs again is read back last wins
+            writer.writerows(rows)
+            self.file_utils.append_to_file(self.status_path, self.cbsa_index_file, output.getvalue().rstrip("\n"))
+        if row_parsed >= total_records:
+            self.file_utils.compact_segments(self.status_path, self.cbsa_index_file)
+
+        logging.info(f"[{self.get_service_name()}] CBSA index saved, matched:{matched}/{len(file_names)}, "
+                     f"indexed:{row_parsed}/{total_records}")
+        self.append_to_log(f"{self.log_id},gen_cbsa_index,file_count,{len(file_names)},success")
+        self.flush_log()
+
+        if row_parsed < total_records:
+            return {
+                "parser": self.get_service_name(),
+                "action": ActionName.PROCESS_CBSA.value,
+                "use_proxy": self.use_proxy,
+                "page_size": self.page_size,
+                "cbsa_page_size": self.cbsa_page_size,
+                "offset": row_parsed,
+                "has_more": True,
+                "offset_end": self.offset_end,
+                "force_fetch": self.force_fetch,
+                "goto_next_step": self.goto_next_step,
+                "version": self.version,
                 "log_id": self.log_id
             }
 
+        return {
+            "parser": self.get_service_name(),
+            "action": ActionName.PROCESS_MENU.value,
+            "use_proxy": self.use_proxy,
+            "page_size": self.page_size,
+            "offset": 0,
+            "has_more": True,
+            "offset_end": self.offset_end,
+            "force_fetch": self.force_fetch,
+            "goto_next_step": self.goto_next_step,
+            "version": self.version,
+            "log_id": self.log_id
+        }
+
+    @staticmethod
+    def cbsa_index_headers():
+        return ['file_name', 'CBSAFP', 'GEOID', 'CSAFP']
+
+    def read_cbsa_index(self):
+        """
+        Returns file_name -> cbsa codes from the side index, empty when the index was not generated
+        """
+        # pages of a run still in progress are appended segments, the merged view has them all
+        content = self.file_utils.read_segmented_file(self.status_path, self.cbsa_index_file)
+        if not content:
+            return {}
+        csv_reader = csv.DictReader(StringIO(content))
+        return {row['file_name']: row for row in csv_reader}
+
     def append_to_log(self, content):
         content = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')},{ActionName.PROCESS_MENU.value},{content}"
         self.append_log.append(content)
@@ -308,18 +529,18 @@ class BaseMenu(JSONMixin, APIMixin):
         content = '\n'.join(self.append_log)
         self.file_utils.append_to_file(self.status_path, self.log_file, content)
 
+    def cbsa_index(self):
+        return CbsaIndex.get(self.cbsa_path_json)
+
     # Function to find the CBSA ID based on latitude and longitude
     def find_cbsa(self, latitude, longitude):
         # CBSAFP and CBSAID are generally the same, both representing the identifier for a CBSA.
         # CSAFP represents a broader Combined Statistical Area that may contain multiple CBSAs.
         # GEOID is a more general geographic code that can be used for many types of regions (not just CBSAs).
 
-        cbsa_data = self.read_from_json_file(self.cbsa_path_json)
+        cbsa_index = self.cbsa_index()
         try:
-            for cbsa in cbsa_data:
-                if (cbsa['min_lat'] <= latitude <= cbsa['max_lat'] and
-                        cbsa['min_lon'] <= longitude <= cbsa['max_lon']):
-                    return cbsa
+            return cbsa_index.lookup(latitude, longitude)
         except Exception as e:
             logging.error(
                 f"[{self.get_service_name()}] Error: Unable to get CBSA")
@@ -1,4 +1,3 @@
-import json
 import logging
 import os
 from datetime import datetime
@@ -7,6 +6,7 @@ from common.APIMixin import APIMixin
 from common.ActionName import ActionName
 from common.JSONMixin import JSONMixin
 from common.LocalUtils import LocalUtils
+from common.Prefetcher import Prefetcher
 from common.S3Utils import S3Utils
 from common.Utils import Utils
 
@@ -15,13 +15,14 @@ class BasePostMenu(JSONMixin, APIMixin):
     def __init__(self, event, parser_path, context):
         self.use_proxy = event["use_proxy"]
         super().__init__(self.use_proxy)
+        self.configure_transport(event)
 
         self.append_log = []
         self.status_path = "status"
         self.log_file = f"{self.get_service_name()}_post_menu.log"
 
         self.running_in_lambda = False
-        self.local_data_path = parser_path + "/data"
+        self.local_data_path = event.get("data_path", parser_path + "/data")
         self.input_file_path = "menu"
         self.output_file_path = "post-menu"
         self.cost_file_path = "post-menu-cost"
@@ -41,6 +42,9 @@ class BasePostMenu(JSONMixin, APIMixin):
         if "offset_end" in event:
             self.offset_end = event["offset_end"]
 
+        self.prefetch_workers = event.get("prefetch_workers", 8)
+        self.prefetch_window = event.get("prefetch_window", 32)
+
         # Instantiate S3Utils or LocalUtils
         if "AWS_LAMBDA_FUNCTION_VERSION" in os.environ:
             print("in Lambda")
@@ -67,20 +71,17 @@ class BasePostMenu(JSONMixin, APIMixin):
         total_records = len(all_files)
         if self.offset_end == -1:
             self.offset_end = total_records + 1
-        row_parsed = 0
         all_parsed = False
         stop_process = False
 
-        for f_name in all_files:
-            if row_parsed >= self.offset:
-                if self.running_in_lambda:
-                    self.file_utils.download_object(os.path.join(self.input_file_path, f_name),
-                                                    os.path.join(self.local_data_path, self.input_file_path, f_name))
-
+        row_parsed = min(self.offset, total_records)
+        page_end = min(self.offset + self.page_size, total_records)
+        # menus of the page are downloaded ahead of parsing, window bounds the look-ahead
+        with Prefetcher(self.__read_menu_json, all_files[row_parsed:page_end],
+                        self.prefetch_workers, self.prefetch_window) as prefetcher:
+            for f_name, item_details_json in prefetcher:
                 item_id = f_name.split(".")[0]
                 try:
-                    item_details_json = self.read_from_json_file(os.path.join(self.local_data_path,
-                                                                              self.input_file_path, f_name))
                     if item_details_json is not None:
                         self.read_menu( item_details_json, item_id, f_name)
                     else:
@@ -88,17 +89,17 @@ class BasePostMenu(JSONMixin, APIMixin):
                 except Exception as e:
                     logging.error(
                         'Data was not inputted for %s because of Error: %s', item_id, e)
-            row_parsed += 1
+                row_parsed += 1
 
-            if row_parsed >= self.offset + self.page_size:
-                logging.info(f"[{self.get_service_name()}] Menu parsed: {row_parsed}/{total_records}")
-                break
+                if row_parsed >= self.offset + self.page_size:
+                    logging.info(f"[{self.get_service_name()}] Menu parsed: {row_parsed}/{total_records}")
+                    break
 
-            if self.get_remaining_time_sec() < 70:
-                logging.info(
-                    f"[{self.get_service_name()}] Function is suspended because of possible timeout: {row_parsed}/{total_records}")
-                # self.page_size = self.offset - row_parsed
-                break
+                if self.get_remaining_time_sec() < 70:
+                    logging.info(
+                        f"[{self.get_service_name()}] Function is suspended because of possible timeout: {row_parsed}/{total_records}")
+                    # self.page_size = self.offset - row_parsed
+                    break
 
         if row_parsed >= self.offset_end:
             logging.info(
@@ -121,7 +122,8 @@ class BasePostMenu(JSONMixin, APIMixin):
                 "page_size": self.page_size,
                 "offset": 0,
                 "has_more": True,
-                "offset_end": self.offset_end,
+                # make.csv starts over all menus, not over the range of this post-menu worker
+                "offset_end": -1,
                 "completed": percentage,
                 "version": self.version,
             }
@@ -153,6 +155,14 @@ class BasePostMenu(JSONMixin, APIMixin):
 
 
 
+    def __read_menu_json(self, f_name):
+        try:
+            return self.file_utils.read_json(self.input_file_path, f_name)
+        except Exception as e:
+            logging.error(
+                'Data was not inputted for %s because of Error: %s', f_name.split(".")[0], e)
+        return None
+
     def read_menu(self, api_response, menu_id, source_name):
         # file_locations = []
         store_detail = api_response['store']
@@ -163,7 +173,7 @@ class BasePostMenu(JSONMixin, APIMixin):
         try:
             # update the source menu file to record the cost file location
             menu_data = {"store": store_detail, "menu_detail": menu_details, "cost_file":file_locations}
-            self.file_utils.write_file(self.output_file_path, source_name, json.dumps(menu_data))
+            self.file_utils.write_file(self.output_file_path, source_name, self.json_dumps(menu_data))
             logging.info(f"[{self.get_service_name()}] successfully write:{source_name} to post-menu file")
         except Exception as e:
             logging.error(f'[{self.get_service_name()}] File %s: Error:%s', menu_id, e)
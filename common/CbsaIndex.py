@@ -0,0 +1,227 @@
+import math
+import os
+import threading
+
+from common.ReferenceData import ReferenceData
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, lookups fall back to plain python loops
+    np = None
+
+# lat cell * stride + lon cell (shifted to be positive) identifies a grid cell in one int64
+CELL_ID_STRIDE = 1 << 32
+
+
+class CbsaIndex:
+    """
+    CBSA geo engine.
+    A uniform grid over the CBSA bounding boxes is used as candidate prefilter: every box is
+    registered in each grid cell it overlaps, so a point query only checks the boxes of a single
+    cell. When prepared geometries (cbsa_polygons.json next to the bounding box file, built by
+    generate_cbsa_polygons.py) are shipped, candidates are confirmed with an exact point in polygon
+    test. Candidates are tried in file order, the same tie-break as the former linear scan: without
+    polygons the first bounding box containing the point wins, so assignments match it exactly.
+    """
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, boxes, polygons=None, cell_size=1.0):
+        self.boxes = boxes
+        self.cell_size = cell_size
+        self.cells = {}
+        self.__table = None
+
+        self.polygons = [None] * len(boxes)
+        if polygons is not None:
+            for idx in range(len(boxes)):
+                edges = polygons.get(boxes.geoid[idx])
+                if edges is not None and np is not None:
+                    edges = tuple(np.frombuffer(column, dtype=np.float64) for column in edges)
+                self.polygons[idx] = edges
+
+        for idx in range(len(boxes)):
+            for lat_cell in range(self.__cell(boxes.min_lat[idx]), self.__cell(boxes.max_lat[idx]) + 1):
+                for lon_cell in range(self.__cell(boxes.min_lon[idx]), self.__cell(boxes.max_lon[idx]) + 1):
+                    self.cells.setdefault((lat_cell, lon_cell), []).append(idx)
+
+    @classmethod
+    def get(cls, cbsa_path_json):
+        """
+        Returns the index for the given bounding box file, it is built only once per process
+        """
+        boxes = ReferenceData.cbsa_boxes(cbsa_path_json)
+        polygons = ReferenceData.cbsa_polygons(os.path.join(os.path.dirname(cbsa_path_json), "cbsa_polygons.json"))
+        with cls._lock:
+            index = cls._instances.get(cbsa_path_json)
+            if index is None or index.boxes is not boxes:
+                index = cls(boxes, polygons)
+                cls._instances[cbsa_path_json] = index
+        return index
+
+    @staticmethod
+    def to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    def __cell(self, value):
+        return math.floor(value / self.cell_size)
+
+    @staticmethod
+    def __contains(edges, latitude, longitude):
+        """
+        Even-odd ray casting of a single point against all edges of a CBSA
+        """
+        lon1, lat1, lon2, lat2 = edges
+        if np is not None:
+            crosses = (lat1 > latitude) != (lat2 > latitude)
+            x = (lon2 - lon1) * (latitude - lat1) / np.where(crosses, lat2 - lat1, 1.0) + lon1
+            return bool(np.count_nonzero(crosses & (longitude < x)) % 2)
+
+        inside = False
+        for x1, y1, x2, y2 in zip(lon1, lat1, lon2, lat2):
+            if (y1 > latitude) != (y2 > latitude) and longitude < (x2 - x1) * (latitude - y1) / (y2 - y1) + x1:
+                inside = not inside
+        return inside
+
+    @staticmethod
+    def __contains_many(edges, lats, lons, max_cells=4000000):
+        """
+        Vectorized ray casting of many points against one CBSA, chunked so points x edges stays bounded
+        """
+        lon1, lat1, lon2, lat2 = edges
+        inside = np.zeros(len(lats), dtype=bool)
+        if len(lon1) == 0:
+            return inside
+        chunk_size = max(1, max_cells // len(lon1))
+        for start in range(0, len(lats), chunk_size):
+            lat = lats[start:start + chunk_size, None]
+            lon = lons[start:start + chunk_size, None]
+            crosses = (lat1 > lat) != (lat2 > lat)
+            x = (lon2 - lon1) * (lat - lat1) / np.where(crosses, lat2 - lat1, 1.0) + lon1
+            inside[start:start + chunk_size] = np.count_nonzero(crosses & (lon < x), axis=1) % 2 == 1
+        return inside
+
+    def __assign(self, latitude, longitude):
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+            cell = (self.__cell(latitude), self.__cell(longitude))
+        except (TypeError, ValueError, OverflowError):
+            return -1
+
+        boxes = self.boxes
+        # candidates are stored in file order, the first confirmed one is the answer
+        for idx in self.cells.get(cell, ()):
+            if (boxes.min_lat[idx] <= latitude <= boxes.max_lat[idx] and
+                    boxes.min_lon[idx] <= longitude <= boxes.max_lon[idx]):
+                edges = self.polygons[idx]
+                if edges is None or self.__contains(edges, latitude, longitude):
+                    return idx
+        return -1
+
+    def lookup(self, latitude, longitude):
+        idx = self.__assign(latitude, longitude)
+        return self.boxes.record(idx) if idx >= 0 else None
+
+    def lookup_many(self, lats, lons):
+        """
+        Batch lookup, returns one CBSA (or None) per latitude/longitude pair
+        """
+        return [self.boxes.record(idx) if idx >= 0 else None for idx in self.assign_many(lats, lons)]
+
+    def __cell_table(self):
+        """
+        The grid as sorted arrays for numpy: encoded cell ids, the start of each cell's candidates
+        in the flat candidate array (file order within a cell) and the cell range covered
+        """
+        if self.__table is None:
+            keys = sorted(self.cells)
+            cell_ids = np.array([self.__cell_id(lat_cell, lon_cell) for lat_cell, lon_cell in keys], dtype=np.int64)
+            starts = np.zeros(len(keys) + 1, dtype=np.int64)
+            starts[1:] = np.cumsum([len(self.cells[key]) for key in keys])
+            candidates = np.array([idx for key in keys for idx in self.cells[key]], dtype=np.int64)
+            lat_cells = [key[0] for key in keys] or [0]
+            lon_cells = [key[1] for key in keys] or [0]
+            has_polygon = np.array([edges is not None for edges in self.polygons], dtype=bool)
+            self.__table = (cell_ids, starts, candidates, has_polygon,
+                            (min(lat_cells), max(lat_cells), min(lon_cells), max(lon_cells)))
+        return self.__table
+
+    @staticmethod
+    def __cell_id(lat_cell, lon_cell):
+        return lat_cell * CELL_ID_STRIDE + lon_cell + CELL_ID_STRIDE // 2
+
+    def assign_many(self, lats, lons):
+        """
+        Returns the position of the matching CBSA for every point, -1 when none contains it.
+        With numpy available the grid cells of all points are found with one searchsorted, the
+        bounding boxes of every (point, candidate) pair are tested at once, and the polygons are
+        confirmed rank by rank (first box hit of each point, then the second for those left...),
+        each CBSA polygon once against all of its points of the rank. Otherwise every point goes
+        through the grid.
+        """
+        if np is None:
+            return [self.__assign(latitude, longitude) for latitude, longitude in zip(lats, lons)]
+
+        lats = np.fromiter((self.to_float(value) for value in lats), dtype=np.float64)
+        lons = np.fromiter((self.to_float(value) for value in lons), dtype=np.float64)
+        result = np.full(len(lats), -1, dtype=np.int64)
+        if len(self.boxes) == 0 or len(lats) == 0:
+            return result.tolist()
+
+        cell_ids, cell_starts, cell_candidates, has_polygon, (lat_low, lat_high, lon_low, lon_high) = self.__cell_table()
+        with np.errstate(invalid='ignore'):
+            lat_cells = np.floor(lats / self.cell_size)
+            lon_cells = np.floor(lons / self.cell_size)
+            # outside the grid (or nan) no cell has candidates, also keeps the ids in int64 range
+            points = np.flatnonzero((lat_cells >= lat_low) & (lat_cells <= lat_high) &
+                                    (lon_cells >= lon_low) & (lon_cells <= lon_high))
+        keys = self.__cell_id(lat_cells[points].astype(np.int64), lon_cells[points].astype(np.int64))
+        position = np.minimum(np.searchsorted(cell_ids, keys), len(cell_ids) - 1)
+        found = cell_ids[position] == keys
+        points, position = points[found], position[found]
+
+        # every (point, candidate) pair, grouped by point with the candidates in file order
+        starts = cell_starts[position]
+        counts = cell_starts[position + 1] - starts
+        pair_point = np.repeat(points, counts)
+        first_pair = np.repeat(np.cumsum(counts) - counts, counts)
+        pair_box = cell_candidates[np.repeat(starts, counts) + np.arange(len(pair_point)) - first_pair]
+
+        min_lat = np.frombuffer(self.boxes.min_lat, dtype=np.float64)
+        max_lat = np.frombuffer(self.boxes.max_lat, dtype=np.float64)
+        min_lon = np.frombuffer(self.boxes.min_lon, dtype=np.float64)
+        max_lon = np.frombuffer(self.boxes.max_lon, dtype=np.float64)
+        lat = lats[pair_point]
+        lon = lons[pair_point]
+        hit = ((min_lat[pair_box] <= lat) & (lat <= max_lat[pair_box]) &
+               (min_lon[pair_box] <= lon) & (lon <= max_lon[pair_box]))
+        pair_point, pair_box = pair_point[hit], pair_box[hit]
+        if len(pair_point) == 0:
+            return result.tolist()
+
+        # rank of each box hit among the hits of its point
+        pair_index = np.arange(len(pair_point))
+        group_start = np.maximum.accumulate(np.where(np.r_[True, pair_point[1:] != pair_point[:-1]], pair_index, 0))
+        rank = pair_index - group_start
+
+        resolved = np.zeros(len(lats), dtype=bool)
+        for current in range(int(rank.max()) + 1):
+            pairs = np.flatnonzero(rank == current)
+            pairs = pairs[~resolved[pair_point[pairs]]]
+            accepted = [pairs[~has_polygon[pair_box[pairs]]]]
+            tested = pairs[has_polygon[pair_box[pairs]]]
+            if len(tested):
+                tested = tested[np.argsort(pair_box[tested], kind='stable')]
+                boxes, box_starts = np.unique(pair_box[tested], return_index=True)
+                for idx, group in zip(boxes.tolist(), np.split(tested, box_starts[1:])):
+                    group_points = pair_point[group]
+                    accepted.append(group[self.__contains_many(self.polygons[idx], lats[group_points], lons[group_points])])
+            accepted = np.concatenate(accepted)
+            result[pair_point[accepted]] = pair_box[accepted]
+            resolved[pair_point[accepted]] = True
+
+        return result.tolist()
@@ -0,0 +1,112 @@
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+PARQUET = "parquet"
+ARROW = "arrow"
+
+
+class ColumnarWriter:
+    """
+    Drop-in for csv.writer writing typed columnar files (parquet or arrow/feather, needs the
+    optional pyarrow package). Rows (sequences in fieldnames order, or dicts keyed by fieldnames
+    like csv.DictWriter) are buffered per column and written as one row group when the writer is
+    closed, so a make.csv page is one row group. Columns listed in dictionary_columns
+    (repeated values like brand or city) are dictionary encoded.
+
+        with ColumnarWriter(key, self.csv_headers(), {"price": "float64"}, ["brand", "city"]) as writer:
+            writer.writerow(row)
+    """
+    suffixes = {PARQUET: ".parquet", ARROW: ".arrow"}
+
+    def __init__(self, file_name, fieldnames, types=None, dictionary_columns=(), output_format=PARQUET):
+        self.check(output_format)
+        self.file_name = file_name
+        self.fieldnames = list(fieldnames)
+        self.types = types or {}
+        self.dictionary_columns = set(dictionary_columns)
+        self.output_format = output_format
+        self.columns = [[] for name in self.fieldnames]
+        self.rows = 0
+
+    @classmethod
+    def check(cls, output_format):
+        if output_format not in cls.suffixes:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        if pyarrow is None:
+            raise ValueError(f"{output_format} output needs the pyarrow package")
+        return output_format
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def writerow(self, row):
+        if isinstance(row, dict):
+            # a gen_csv_row dict, like DictWriter
+            row = [row.get(name) for name in self.fieldnames]
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        self.rows += 1
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def __convert(self, values, column_type):
+        if column_type == "float64":
+            convert = float
+        elif column_type == "int64":
+            convert = int
+        else:
+            convert = str
+        converted = []
+        for value in values:
+            try:
+                converted.append(None if value is None else convert(value))
+            except (ValueError, TypeError):
+                # e.g. 'N/A' in a numeric column
+                converted.append(None)
+        return converted
+
+    def table(self):
+        arrays = []
+        for name, values in zip(self.fieldnames, self.columns):
+            column_type = self.types.get(name, "string")
+            array = pyarrow.array(self.__convert(values, column_type), type=pyarrow.type_for_alias(column_type))
+            if name in self.dictionary_columns:
+                array = array.dictionary_encode()
+            arrays.append(array)
+        return pyarrow.Table.from_arrays(arrays, names=self.fieldnames)
+
+    @classmethod
+    def concat(cls, file_names, file_name, output_format=PARQUET):
+        """
+        Joins files written by ColumnarWriter, in order, into one file with a single row group
+        """
+        cls.check(output_format)
+        read = pyarrow.parquet.read_table if output_format == PARQUET else pyarrow.feather.read_table
+        table = pyarrow.concat_tables([read(name) for name in file_names]).unify_dictionaries().combine_chunks()
+        cls.__write(table, file_name, output_format)
+
+    @staticmethod
+    def __write(table, file_name, output_format):
+        if output_format == PARQUET:
+            pyarrow.parquet.write_table(table, file_name, row_group_size=max(1, table.num_rows), compression="zstd")
+        else:
+            pyarrow.feather.write_feather(table, file_name, compression="zstd")
+        logging.info(f"[columnar] Wrote {table.num_rows} rows to {file_name}")
+
+    def close(self):
+        if self.columns is None:
+            return
+        self.__write(self.table(), self.file_name, self.output_format)
+        self.columns = None
@@ -0,0 +1,77 @@
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+
+class Compression:
+    """
+    gzip / zstd encoding of stored artifacts (zstd needs the optional zstandard package).
+    The encoding of an object is negotiated by key suffix (.gz, .zst), by its ContentEncoding
+    metadata on S3, or by the magic bytes of the content, so readers never need to be told.
+    """
+    suffixes = {".gz": GZIP, ".zst": ZSTD}
+    magic = {b"\x1f\x8b": GZIP, b"\x28\xb5\x2f\xfd": ZSTD}
+
+    @classmethod
+    def encoding_for(cls, file_name):
+        for suffix, encoding in cls.suffixes.items():
+            if file_name.endswith(suffix):
+                return encoding
+        return None
+
+    @classmethod
+    def sniff(cls, head):
+        """
+        Encoding from the first bytes of the content, None when it is not compressed
+        """
+        for magic, encoding in cls.magic.items():
+            if head.startswith(magic):
+                return encoding
+        return None
+
+    @staticmethod
+    def check(encoding):
+        if encoding not in (None, GZIP, ZSTD):
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        if encoding == ZSTD and zstandard is None:
+            raise ValueError("zstd encoding needs the zstandard package")
+        return encoding
+
+    @classmethod
+    def compress(cls, content, encoding):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        cls.check(encoding)
+        if encoding == GZIP:
+            # fixed mtime, the same content always gives the same object
+            return gzip.compress(data, compresslevel=6, mtime=0)
+        if encoding == ZSTD:
+            return zstandard.ZstdCompressor(level=6).compress(data)
+        return data
+
+    @classmethod
+    def open_stream(cls, fileobj, encoding):
+        """
+        Binary file-like object decompressing fileobj while it is read
+        """
+        cls.check(encoding)
+        if encoding == GZIP:
+            return gzip.GzipFile(fileobj=fileobj, mode='rb')
+        if encoding == ZSTD:
+            return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+        return fileobj
+
+    @classmethod
+    def open_sniffed(cls, fileobj, encoding=None):
+        """
+        Same as open_stream, the encoding is read from the magic bytes when not given
+        (fileobj must support peek, e.g. a file opened with 'rb')
+        """
+        if encoding is None:
+            encoding = cls.sniff(fileobj.peek(4)[:4])
+        return cls.open_stream(fileobj, encoding)
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# threads shared by every engine of the process, parsers rebuilt on warm invocations reuse them
+MAX_WORKERS = 16
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class CrawlEngine:
+    """
+    Asyncio fan-out engine for multi level crawls (e.g. section -> sub-section -> product).
+    The blocking fetch functions (APIMixin calls) run on a process wide thread pool, a semaphore per
+    host bounds how many requests are in flight against it. map() keeps the input order, so
+    callers get the same result as with a sequential loop.
+
+        products = engine.run(self.crawl(...))   # from sync code
+        pages = await engine.map(host, self.fetch_page, [(arg1, arg2), ...])   # inside the coroutine
+    """
+    def __init__(self, max_per_host=4):
+        self.max_per_host = max_per_host
+        self.__semaphores = {}
+
+    @staticmethod
+    def get_executor():
+        """
+        Process wide thread pool, created on first use and kept across engines and warm invocations
+        """
+        global _executor
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="crawl")
+        return _executor
+
+    def run(self, coroutine):
+        """
+        Runs a crawl coroutine to completion from synchronous code
+        """
+        # semaphores belong to the event loop they were first used on
+        self.__semaphores = {}
+        return asyncio.run(coroutine)
+
+    def __semaphore(self, host):
+        semaphore = self.__semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self.__semaphores[host] = semaphore
+        return semaphore
+
+    async def fetch(self, host, fn, *args):
+        """
+        Calls fn(*args) on the thread pool while holding one of the host's slots
+        (request pacing is done by the APIMixin rate limiter)
+        """
+        async with self.__semaphore(host):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.get_executor(), partial(fn, *args))
+
+    async def map(self, host, fn, args_list):
+        """
+        Fetches fn(*args) for every args tuple concurrently, results are returned in input order
+        """
+        return await asyncio.gather(*(self.fetch(host, fn, *args) for args in args_list))
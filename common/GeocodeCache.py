@@ -0,0 +1,140 @@
+import csv
+import logging
+import os
+import uuid
+from datetime import datetime
+from io import StringIO
+
+
+class GeocodeCache:
+    """
+    In-memory address -> (lat, long) cache backed by the {service}_address_cache.csv file.
+
+    The canonical file is never rewritten by CSV workers: every worker buffers its new entries
+    and each flush writes them as a new immutable delta shard under {service}_address_cache_delta/
+    ({worker_id}_{flush}.csv, a shard is never rewritten). Readers load the canonical file plus
+    every shard, so they see the union without any lock. compact() folds the shards it read into
+    the canonical file and deletes exactly those, so it can run while other workers still flush:
+    their new shards are left for the next compaction. Only one compaction may run at a time (the
+    make.csv chain that reaches the last menu).
+    """
+    fieldnames = ['address', 'lat', 'long']
+
+    def __init__(self, file_utils, cache_path, file_name, worker_id=None):
+        self.file_utils = file_utils
+        self.cache_path = cache_path
+        self.file_name = file_name
+        self.delta_path = os.path.join(cache_path, f"{os.path.splitext(file_name)[0]}_delta")
+        if worker_id is None:
+            worker_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.worker_id = worker_id
+        self.flushes = 0
+        self.entries = {}
+        self.pending = {}
+        self.misses = set()
+        self.loaded = False
+
+    def __read_rows(self, path, file_name):
+        try:
+            content = self.file_utils.read_file(path, file_name)
+        except Exception:
+            # missing canonical file or a shard removed by a compaction in between
+            return None
+        return list(csv.DictReader(StringIO(content or "")))
+
+    def __shard_names(self):
+        try:
+            shards = self.file_utils.list(self.delta_path)
+        except Exception:
+            return []
+        return sorted(shard for shard in shards if shard.endswith(".csv"))
+
+    def __to_csv(self, entries):
+        output = StringIO()
+        writer = csv.DictWriter(output, fieldnames=self.fieldnames)
+        writer.writeheader()
+        for address, (lat, long) in entries.items():
+            writer.writerow({'address': address, 'lat': lat, 'long': long})
+        return output.getvalue()
+
+    def __read_all(self):
+        """
+        Canonical entries plus every delta shard, returns the entries and the shards that were read
+        """
+        entries = {}
+        shards = []
+        for path, file_name in [(self.cache_path, self.file_name)] + [(self.delta_path, s) for s in self.__shard_names()]:
+            rows = self.__read_rows(path, file_name)
+            if rows is None:
+                continue
+            if path == self.delta_path:
+                shards.append(file_name)
+            for row in rows:
+                # first entry wins, same as the old top to bottom scan
+                entries.setdefault(row['address'], (row['lat'], row['long']))
+        return entries, shards
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        entries, shards = self.__read_all()
+        for address, value in entries.items():
+            self.entries.setdefault(address, value)
+        logging.info(f"[geocode] Loaded {len(self.entries)} cached addresses, delta shards:{len(shards)}")
+
+    def get(self, address):
+        """
+        Returns (lat, long) for a known address, (None, None) for an address that already failed
+        to resolve during this run and None when the address has to be geocoded
+        """
+        self.load()
+        if address in self.entries:
+            return self.entries[address]
+        if address in self.misses:
+            return None, None
+        return None
+
+    def put(self, address, lat, long):
+        self.load()
+        if lat and long:
+            self.entries[address] = (lat, long)
+            self.pending[address] = (lat, long)
+        else:
+            # not persisted, only avoids geocoding the same bad address again in this run
+            self.misses.add(address)
+
+    @property
+    def dirty(self):
+        return len(self.pending) > 0
+
+    def flush(self):
+        """
+        Persist buffered entries as a new delta shard of this worker, returns True when something was written
+        """
+        if not self.pending:
+            return False
+
+        self.flushes += 1
+        shard_name = f"{self.worker_id}_{self.flushes:04d}.csv"
+        self.file_utils.write_file(self.delta_path, shard_name, self.__to_csv(self.pending))
+        logging.info(f"[geocode] Saved {len(self.pending)} new addresses to shard:{shard_name}")
+        self.pending.clear()
+        return True
+
+    def compact(self):
+        """
+        Merge the delta shards into the canonical cache file, returns the number of merged shards.
+        Shards are immutable, so the ones read for this write are deleted and any shard written
+        meanwhile stays for the next compaction.
+        """
+        self.flush()
+        entries, shards = self.__read_all()
+        if not shards:
+            return 0
+
+        self.file_utils.write_file(self.cache_path, self.file_name, self.__to_csv(entries))
+        for shard in shards:
+            self.file_utils.delete_file(self.delta_path, shard)
+        logging.info(f"[geocode] Compacted {len(shards)} shards, total addresses:{len(entries)}")
+        return len(shards)
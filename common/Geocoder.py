@@ -0,0 +1,72 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from common.RateLimiter import TokenBucket
+
+_location_client = None
+_location_client_lock = threading.Lock()
+
+
+def location_client(max_pool_connections=10):
+    """
+    One Amazon Location client per process, boto3 clients are thread safe and keep their own connection pool
+    """
+    global _location_client
+    with _location_client_lock:
+        if _location_client is None:
+            _location_client = boto3.client('location', config=Config(max_pool_connections=max_pool_connections))
+    return _location_client
+
+
+class Geocoder:
+    """
+    Resolves addresses through Amazon Location search_place_index_for_text.
+    Distinct uncached addresses of a batch are geocoded concurrently on a bounded thread pool,
+    calls go through a token bucket of rate_per_sec, and results are stored in the GeocodeCache.
+    The client can be injected (e.g. a local stub exposing search_place_index_for_text).
+    """
+    def __init__(self, cache, client=None, max_workers=4, rate_per_sec=10, index_name='Address2Location'):
+        self.cache = cache
+        self.client = client
+        self.max_workers = max_workers
+        self.rate_per_sec = rate_per_sec
+        self.index_name = index_name
+        self.bucket = TokenBucket(rate_per_sec) if rate_per_sec else None
+
+    def fetch(self, address):
+        """
+        Fetches latitude and longitude from Amazon Location Service using the given address.
+        """
+        if self.client is None:
+            self.client = location_client(self.max_workers)
+        if self.bucket is not None:
+            self.bucket.acquire()
+        try:
+            response = self.client.search_place_index_for_text(
+                IndexName=self.index_name,
+                Text=address
+            )
+            if response['Results']:
+                coordinates = response['Results'][0]['Place']['Geometry']['Point']
+                # Amazon Location API returns coordinates as [longitude, latitude]
+                return coordinates[1], coordinates[0]
+        except Exception as e:
+            print(f"Error fetching lat/long for address '{address}': {e}")
+        return None, None
+
+    def resolve_many(self, addresses):
+        """
+        Geocodes every distinct address missing from the cache, returns address -> (lat, long) for all of them
+        """
+        pending = [address for address in dict.fromkeys(addresses) if self.cache.get(address) is None]
+        if pending:
+            logging.info(f"[geocode] Resolving {len(pending)} addresses, workers:{self.max_workers}")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for address, (lat, long) in zip(pending, executor.map(self.fetch, pending)):
+                    self.cache.put(address, lat, long)
+
+        return {address: self.cache.get(address) for address in dict.fromkeys(addresses)}
@@ -3,15 +3,92 @@ import csv
 
 from io import StringIO
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 
 class JSONMixin:
+    """
+    JSON codec of the parsers: orjson when it is installed, stdlib json otherwise (same documents,
+    orjson writes them without the optional spaces). stream_items parses incrementally with ijson
+    when it is installed.
+    """
+    @staticmethod
+    def json_loads(data):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    @staticmethod
+    def json_dumps(obj):
+        if orjson is not None:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return json.dumps(obj)
+
+    @staticmethod
+    def json_load(file):
+        return JSONMixin.json_loads(file.read())
+
+    @staticmethod
+    def stream_items(file, *prefixes):
+        """
+        Yields (prefix, value) for every value found at one of the ijson style prefixes
+        (e.g. "store", "menu_detail.data.item") in document order, without building the rest
+        of the document. Without ijson the document is loaded at once and walked instead.
+        """
+        if ijson is None:
+            document = JSONMixin.json_load(file)
+            for prefix in prefixes:
+                yield from ((prefix, value) for value in JSONMixin.__walk(document, prefix.split(".")))
+            return
+
+        if len(prefixes) == 1:
+            # objects are built by the ijson backend itself
+            yield from ((prefixes[0], value) for value in ijson.items(file, prefixes[0], use_float=True))
+            return
+
+        # values nested in an already captured value are part of it and not yielded on their own
+        builder, current = None, None
+        for event_prefix, event, value in ijson.parse(file, use_float=True):
+            if builder is None:
+                if event_prefix not in prefixes or event in ('map_key', 'end_map', 'end_array'):
+                    continue
+                if event not in ('start_map', 'start_array'):
+                    yield event_prefix, value
+                    continue
+                builder, current = ijson.ObjectBuilder(), event_prefix
+            builder.event(event, value)
+            if event_prefix == current and event in ('end_map', 'end_array'):
+                yield current, builder.value
+                builder, current = None, None
+
+    @staticmethod
+    def __walk(value, path):
+        if not path:
+            yield value
+            return
+        head, rest = path[0], path[1:]
+        if head == "item":
+            if isinstance(value, list):
+                for item in value:
+                    yield from JSONMixin.__walk(item, rest)
+        elif isinstance(value, dict) and head in value:
+            yield from JSONMixin.__walk(value[head], rest)
+
     @staticmethod
     def read_from_json_file(file_name):
-        with open(file_name, 'r') as file:
+        with open(file_name, 'rb') as file:
             # Read the entire content of the file
             file_data = file.read()
 
-        json_content = json.loads(file_data)
+        json_content = JSONMixin.json_loads(file_data)
         return json_content
 
     @staticmethod
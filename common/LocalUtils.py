@@ -1,7 +1,10 @@
+import io
 import os
+from contextlib import closing, contextmanager
 
 from botocore.exceptions import ClientError
 
+from common.Compression import Compression
 from common.S3Utils import S3Utils
 
 
@@ -17,7 +20,17 @@ class LocalUtils(S3Utils):
         only_files = [f for f in listdir(key) if os.path.isfile(os.path.join(key, f))]
         return only_files
 
+    def snapshot(self, local_path):
+        prefix = os.path.normpath(local_path)
+        folder = os.path.join(self.folder, prefix)
+        names = os.listdir(folder) if os.path.isdir(folder) else []
+        self.snapshots[prefix] = {os.path.join(prefix, f) for f in names if os.path.isfile(os.path.join(folder, f))}
+        return len(self.snapshots[prefix])
+
     def file_exists(self, local_path, file_name):
+        exists = self._snapshot_contains(os.path.join(local_path, file_name))
+        if exists is not None:
+            return exists
         try:
             key = os.path.join(self.folder, local_path, file_name)
             if os.path.isfile(key):
@@ -28,15 +41,32 @@ class LocalUtils(S3Utils):
             return False
 
     def read_file(self, local_path, file_name):
-        key = os.path.join(self.folder, local_path, file_name)
-        with open(key, 'r') as file:
-            return file.read()
+        with self.open_object(local_path, file_name) as file:
+            return io.TextIOWrapper(file, encoding='utf-8').read()
+
+    @contextmanager
+    def open_object(self, local_path, file_name):
+        # gzip/zstd files are recognized by suffix or magic bytes and decompressed while read
+        with open(os.path.join(self.folder, local_path, file_name), 'rb') as file:
+            with closing(Compression.open_sniffed(file, Compression.encoding_for(file_name))) as stream:
+                yield stream
 
-    def write_file(self, local_path, file_name, content):
+    def read_range(self, local_path, file_name, start, length):
+        with open(os.path.join(self.folder, local_path, file_name), 'rb') as file:
+            file.seek(start)
+            return file.read(length)
+
+    def write_file(self, local_path, file_name, content, encoding=None):
         key = os.path.join(self.folder, local_path, file_name)
         os.makedirs(os.path.dirname(key), exist_ok=True)
-        with open(key, 'w', newline='', encoding='utf-8') as file:
-            file.write(content)
+        encoding = encoding or Compression.encoding_for(file_name)
+        if encoding:
+            with open(key, 'wb') as file:
+                file.write(Compression.compress(content, encoding))
+        else:
+            with open(key, 'w', newline='', encoding='utf-8') as file:
+                file.write(content)
+        self._snapshot_add(os.path.join(local_path, file_name))
 
     def append_to_file(self, local_path, file_name, content):
         key = os.path.join(self.folder, local_path, file_name)
@@ -44,3 +74,22 @@ class LocalUtils(S3Utils):
         with open(key, 'a', newline='', encoding='utf-8') as file:
             file.write(content)
             file.write("\n")
+        self._snapshot_add(os.path.join(local_path, file_name))
+
+    def read_segmented_file(self, local_path, file_name):
+        # local appends go straight to the file, there are no segments
+        if not self.file_exists(local_path, file_name):
+            return ""
+        return self.read_file(local_path, file_name).rstrip("\n")
+
+    def compact_segments(self, local_path, file_name):
+        return 0
+
+    def delete_file(self, local_path, file_name):
+        key = os.path.join(self.folder, local_path, file_name)
+        try:
+            os.remove(key)
+        except OSError:
+            return False
+        self._snapshot_discard(os.path.join(local_path, file_name))
+        return True
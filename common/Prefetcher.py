@@ -0,0 +1,79 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """
+    Bounded look-ahead loader: load(item) runs on a thread pool for up to `window` upcoming items
+    while the caller consumes the results in input order, so downloads keep running ahead of parsing.
+    Leaving the with block (e.g. breaking out when the invocation runs low on time) cancels the loads
+    that have not started yet and passes the results loaded but never consumed to release (e.g. to
+    close the open object bodies they hold).
+
+        with Prefetcher(self.read_json, files, max_workers=8, window=32) as prefetcher:
+            for f_name, content in prefetcher:
+                ...
+    """
+    def __init__(self, load, items, max_workers=8, window=32, release=None):
+        self.load = load
+        self.release = release
+        self.items = list(items)
+        self.max_workers = max(1, max_workers)
+        self.window = max(1, window)
+        self.__executor = None
+        self.__pending = deque()
+
+    def __enter__(self):
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self.__executor is None:
+            return
+        cancelled = sum(1 for item, future in self.__pending if future.cancel())
+        if cancelled:
+            logging.info(f"[prefetch] Cancelled {cancelled} pending loads")
+        self.__executor.shutdown(wait=True)
+        self.__executor = None
+        if self.release is not None:
+            for item, future in self.__pending:
+                if not future.cancelled() and future.exception() is None:
+                    try:
+                        self.release(future.result())
+                    except Exception as e:
+                        logging.error(f"[prefetch] Unable to release {item}: {e}")
+        self.__pending.clear()
+
+    def __iter__(self):
+        """
+        Yields (item, load(item)) in input order, an exception raised by load is raised here
+        """
+        upcoming = iter(self.items)
+        for item in upcoming:
+            self.__pending.append((item, self.__executor.submit(self.load, item)))
+            if len(self.__pending) >= self.window:
+                break
+        while self.__pending:
+            item, future = self.__pending.popleft()
+            for next_item in upcoming:
+                self.__pending.append((next_item, self.__executor.submit(self.load, next_item)))
+                break
+            yield item, future.result()
+
+    def batches(self, size):
+        """
+        Same as iterating, grouped in lists of up to size (item, result) pairs
+        """
+        batch = []
+        for pair in self:
+            batch.append(pair)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
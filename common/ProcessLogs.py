@@ -7,6 +7,7 @@ from datetime import datetime
 import json
 
 from common.S3Utils import S3Utils
+from common.ShardStore import ShardStore
 
 
 class ProcessLogs:
@@ -44,6 +45,9 @@ class ProcessLogs:
         if "log_id" in events:
             self.log_id = events["log_id"]
 
+        self.compact_logs = events.get("compact_logs", True)
+        self.artifact_format = events.get("artifact_format", "files")
+
 
         if "AWS_LAMBDA_FUNCTION_VERSION" in os.environ:
             print("in lambda")
@@ -60,10 +64,13 @@ class ProcessLogs:
     def read_log_file(self,filename):
         if self.running_in_lambda:
             self.log_file_path = os.path.join(self.local_data_path, self.status_path)
-            if self.file_utils.file_exists(self.status_path,filename):
-                print("Downloading from s3: " + str(os.path.join(self.status_path, filename)))
-                self.file_utils.download_object(os.path.join(self.status_path, filename),
-                                                os.path.join(self.local_data_path, self.status_path, filename))
+            os.makedirs(self.log_file_path, exist_ok=True)
+            # logs are appended as segments, read the merged view and fold the segments back in
+            print("Reading from s3: " + str(os.path.join(self.status_path, filename)))
+            content = self.file_utils.read_segmented_file(self.status_path, filename)
+            if self.compact_logs:
+                self.file_utils.compact_segments(self.status_path, filename)
+            return content.splitlines(keepends=True)
 
         print(f"currently opening: {self.log_file_path}/{filename}")
         with open(os.path.join(self.log_file_path,filename),"r") as file:
@@ -71,6 +78,16 @@ class ProcessLogs:
 
         return logs
 
+    def count_menu_shards(self, parser):
+        """
+        Menus stored in the shards written by gen_menu, read from the shard indexes
+        """
+        if self.running_in_lambda:
+            shard_store = ShardStore(self.file_utils, f"menu-shards/{self.status_path.split('/')[1]}/{parser}")
+        else:
+            shard_store = ShardStore(LocalUtils(os.path.dirname(os.path.normpath(self.log_file_path))), "menu-shards")
+        return shard_store.load_index()
+
     def process(self,parser_name=None):
         if parser_name:
             parser_value = ParserName[parser_name].value
@@ -96,7 +113,7 @@ class ProcessLogs:
                     id = log.split(",")[2].strip()
                     if id == self.log_id:
                         total_records += 1
-                        if log.split(",")[3] == "generate_files_list":
+                        if log.split(",")[3] in ("generate_files_list", "gen_cbsa_index"):
                             total_records -= 1
                         else:
                             filtered_logs.append(log)
@@ -124,6 +141,8 @@ class ProcessLogs:
                 "Failed_Hits": failure,
                 "Percentage_Failure": round(percentage_failure,3)
             }
+            if action_name == "menu" and self.artifact_format == "shards":
+                report["Stored_Records"] = self.count_menu_shards(parser)
             # reports.append(report)
             print(report)
             output_file_path = os.path.join(self.log_file_path,
@@ -162,17 +181,19 @@ class ProcessLogs:
                     "page_size": self.page_size,
                     "offset": 0,
                     "has_more": True,
-                    "offset_end": self.offset_end,
+                    # offset_end of the menu stage counts locations, the next stage runs over all menus
+                    "offset_end": -1,
                     "force_fetch": self.force_fetch,
                     "goto_next_step": self.goto_next_step,
                     "completed": self.completed,
-                    "version": self.version
+                    "version": self.version,
+                    "artifact_format": self.artifact_format
                 }
 
             elif action_name == "locations":
                 return {
                     "parser": parser,
-                    "action": ActionName.PROCESS_MENU.value,
+                    "action": ActionName.PROCESS_CBSA.value,
                     "use_proxy": self.use_proxy,
                     "page_size": self.page_size,
                     "offset": 0,
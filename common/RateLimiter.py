@@ -0,0 +1,86 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket: refills at rate tokens per second up to burst tokens.
+    A caller that finds the bucket empty reserves the next token and sleeps until it is due,
+    so concurrent callers are spaced out instead of stampeding when tokens come back.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(1.0, rate))
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, returns the seconds spent waiting for it
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """
+    One token bucket per host. rate is the default requests/sec for every host, host_rates
+    overrides it per host (e.g. {"shop.imtiaz.com.pk": 4}), a rate of None/0 means unlimited.
+    Calls and waits are summarized per host (count, total, max) for stats().
+    """
+    def __init__(self, rate=None, burst=None, host_rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = host_rates or {}
+        self.buckets = {}
+        self.waits = {}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, rate_limit, burst=None):
+        """
+        rate_limit is either a number (all hosts) or a dict host -> rate, with an optional "default" key
+        """
+        if isinstance(rate_limit, dict):
+            host_rates = dict(rate_limit)
+            return cls(host_rates.pop("default", None), burst, host_rates)
+        return cls(rate_limit, burst)
+
+    def __bucket(self, host):
+        with self.__lock:
+            if host not in self.buckets:
+                rate = self.host_rates.get(host, self.rate)
+                self.buckets[host] = TokenBucket(rate, self.burst) if rate else None
+                self.waits[host] = [0, 0.0, 0.0]
+            return self.buckets[host]
+
+    def acquire(self, url):
+        """
+        Blocks until a request to the url's host is allowed, returns the seconds waited
+        """
+        host = urlparse(url).netloc or url
+        bucket = self.__bucket(host)
+        wait = bucket.acquire() if bucket is not None else 0.0
+        with self.__lock:
+            waits = self.waits[host]
+            waits[0] += 1
+            waits[1] += wait
+            waits[2] = max(waits[2], wait)
+        return wait
+
+    def stats(self):
+        """
+        Calls, total and max wait (seconds) per host
+        """
+        with self.__lock:
+            return {host: {"calls": calls, "total_wait_sec": round(total, 3), "max_wait_sec": round(longest, 3)}
+                    for host, (calls, total, longest) in self.waits.items()}
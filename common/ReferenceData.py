@@ -0,0 +1,178 @@
+import csv
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+
+from common.JSONMixin import JSONMixin
+
+
+class CbsaBoxes:
+    """
+    Array backed copy of cbsa_bounding_boxes.json, one slot per CBSA in file order
+    """
+    def __init__(self, cbsa_data):
+        self.min_lat = array('d', (cbsa['min_lat'] for cbsa in cbsa_data))
+        self.max_lat = array('d', (cbsa['max_lat'] for cbsa in cbsa_data))
+        self.min_lon = array('d', (cbsa['min_lon'] for cbsa in cbsa_data))
+        self.max_lon = array('d', (cbsa['max_lon'] for cbsa in cbsa_data))
+        self.cbsafp = tuple(sys.intern(str(cbsa['CBSAFP'])) for cbsa in cbsa_data)
+        self.geoid = tuple(sys.intern(str(cbsa['GEOID'])) for cbsa in cbsa_data)
+        self.csafp = tuple(sys.intern(str(cbsa['CSAFP'])) for cbsa in cbsa_data)
+        self.__records = [None] * len(self.cbsafp)
+
+    def __len__(self):
+        return len(self.cbsafp)
+
+    def record(self, idx):
+        """
+        Returns the CBSA at idx in the same dict shape as the json file
+        """
+        cbsa = self.__records[idx]
+        if cbsa is None:
+            cbsa = {
+                'CBSAFP': self.cbsafp[idx],
+                'GEOID': self.geoid[idx],
+                'CSAFP': self.csafp[idx],
+                'min_lat': self.min_lat[idx],
+                'max_lat': self.max_lat[idx],
+                'min_lon': self.min_lon[idx],
+                'max_lon': self.max_lon[idx],
+            }
+            self.__records[idx] = cbsa
+        return cbsa
+
+    def size_bytes(self):
+        size = sum(sys.getsizeof(a) for a in (self.min_lat, self.max_lat, self.min_lon, self.max_lon))
+        for codes in (self.cbsafp, self.geoid, self.csafp):
+            size += sys.getsizeof(codes) + sum(sys.getsizeof(code) for code in set(codes))
+        return size
+
+
+class CbsaPolygons:
+    """
+    Prepared CBSA geometries keyed by GEOID.
+    All rings of a CBSA (outer rings and holes) are flattened into one edge list stored as
+    four array('d') columns (lon1, lat1, lon2, lat2), an even-odd crossing test over that
+    list gives exact containment for polygons, multipolygons and holes.
+    """
+    def __init__(self, geojson):
+        self.edges = {}
+        for feature in geojson.get('features', []):
+            properties = feature.get('properties') or {}
+            geometry = feature.get('geometry') or {}
+            geoid = properties.get('GEOID')
+            if geoid is None:
+                continue
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+
+            lon1, lat1, lon2, lat2 = array('d'), array('d'), array('d'), array('d')
+            for polygon in polygons:
+                for ring in polygon:
+                    for start, end in zip(ring, ring[1:] + ring[:1]):
+                        if start[1] == end[1]:
+                            # horizontal edges never cross the ray
+                            continue
+                        lon1.append(start[0])
+                        lat1.append(start[1])
+                        lon2.append(end[0])
+                        lat2.append(end[1])
+            self.edges[sys.intern(str(geoid))] = (lon1, lat1, lon2, lat2)
+
+    def __len__(self):
+        return len(self.edges)
+
+    def get(self, geoid):
+        return self.edges.get(geoid)
+
+    def size_bytes(self):
+        return sum(sys.getsizeof(column) for edges in self.edges.values() for column in edges)
+
+
+class ReferenceData:
+    """
+    Process wide cache for the CBSA reference files.
+    The files are parsed once per process (i.e. once per warm Lambda container) and shared
+    by every BaseMenu, BaseJsonToCsv and parser instance.
+    """
+    _cbsa_boxes = {}
+    _cbsa_names = {}
+    _cbsa_polygons = {}
+    _stats = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def cbsa_boxes(cls, cbsa_path_json):
+        cbsa_path_json = os.path.abspath(cbsa_path_json)
+        with cls._lock:
+            boxes = cls._cbsa_boxes.get(cbsa_path_json)
+            if boxes is None:
+                start = time.perf_counter()
+                boxes = CbsaBoxes(JSONMixin.read_from_json_file(cbsa_path_json))
+                cls._cbsa_boxes[cbsa_path_json] = boxes
+                cls.__record_stats(cbsa_path_json, start, len(boxes), boxes.size_bytes())
+        return boxes
+
+    @classmethod
+    def cbsa_polygons(cls, cbsa_path_geojson):
+        """
+        CBSA geometries (GeoJSON FeatureCollection with a GEOID property), None when the file is not shipped
+        """
+        cbsa_path_geojson = os.path.abspath(cbsa_path_geojson)
+        with cls._lock:
+            if cbsa_path_geojson not in cls._cbsa_polygons:
+                polygons = None
+                if os.path.exists(cbsa_path_geojson):
+                    start = time.perf_counter()
+                    polygons = CbsaPolygons(JSONMixin.read_from_json_file(cbsa_path_geojson))
+                    cls.__record_stats(cbsa_path_geojson, start, len(polygons), polygons.size_bytes())
+                cls._cbsa_polygons[cbsa_path_geojson] = polygons
+        return cls._cbsa_polygons[cbsa_path_geojson]
+
+    @classmethod
+    def cbsa_names(cls, cbsa_path, file_name="cbsa_db.csv"):
+        """
+        geo_id -> name map read from cbsa_db.csv
+        """
+        key = os.path.abspath(os.path.join(cbsa_path, file_name))
+        with cls._lock:
+            names = cls._cbsa_names.get(key)
+            if names is None:
+                start = time.perf_counter()
+                names = {}
+                with open(key, 'r', newline='', encoding='utf-8') as csv_file:
+                    for row in csv.DictReader(csv_file):
+                        names[sys.intern(row['geo_id'])] = row['name']
+                cls._cbsa_names[key] = names
+                size = sys.getsizeof(names) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in names.items())
+                cls.__record_stats(key, start, len(names), size)
+        return names
+
+    @classmethod
+    def __record_stats(cls, key, start, records, size):
+        load_time = time.perf_counter() - start
+        cls._stats[key] = {"records": records, "load_time_sec": round(load_time, 4), "size_bytes": size}
+        logging.info(f"[reference] Loaded {key}: records:{records}, time:{load_time:.4f}s, size:{size} bytes")
+
+    @classmethod
+    def stats(cls):
+        """
+        Load time and approximate memory footprint of every cached reference file
+        """
+        with cls._lock:
+            return {key: dict(value) for key, value in cls._stats.items()}
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._cbsa_boxes.clear()
+            cls._cbsa_names.clear()
+            cls._cbsa_polygons.clear()
+            cls._stats.clear()
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlencode
+
+
+class ResponseCache:
+    """
+    Run wide cache for structural endpoints (category trees) shared across branches. Entries are
+    keyed by url + the request parameters that do not depend on the branch, expire after ttl_sec and
+    carry the sha256 of the response they were derived from (e.g. a branch's menu sections):
+    get() only answers for a caller whose own response hashes the same, so a branch with a
+    different tree fetches it again. The cache is persisted as json to the status path so the
+    chained invocations of a run share it.
+
+        tree = cache.get(key, cache.content_hash(menu_sections))
+    """
+    def __init__(self, file_utils, path, file_name, ttl_sec=6 * 3600):
+        self.file_utils = file_utils
+        self.path = path
+        self.file_name = file_name
+        self.ttl_sec = ttl_sec
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, params):
+        return url + "?" + urlencode(sorted(params.items()))
+
+    @staticmethod
+    def content_hash(data):
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def load(self):
+        self.entries = {}
+        if not self.ttl_sec or not self.file_utils.file_exists(self.path, self.file_name):
+            return
+        try:
+            entries = json.loads(self.file_utils.read_file(self.path, self.file_name))
+        except Exception as e:
+            logging.error(f"Unable to read response cache {self.file_name}: {e}")
+            return
+        for key, entry in entries.items():
+            if isinstance(entry, dict) and {'fetched_at', 'hash', 'data'} <= entry.keys():
+                self.entries[key] = entry
+            else:
+                logging.info(f"Dropping malformed response cache entry: {key}")
+
+    def get(self, key, content_hash):
+        """
+        Cached data for the key when it was derived from a response with this content hash,
+        None when missing, expired or built from a different response
+        """
+        with self.__lock:
+            entry = self.entries.get(key)
+            if (entry is None or not self.ttl_sec or time.time() - entry['fetched_at'] > self.ttl_sec
+                    or entry['hash'] != content_hash):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry['data']
+
+    def put(self, key, data, content_hash):
+        """
+        Stores data derived from the response with content_hash, replacing any other version
+        """
+        if not self.ttl_sec:
+            return
+        with self.__lock:
+            self.entries[key] = {'fetched_at': time.time(), 'hash': content_hash, 'data': data}
+            self.dirty = True
+
+    def save(self):
+        with self.__lock:
+            if not self.dirty:
+                return
+            content = json.dumps(self.entries)
+            self.dirty = False
+        self.file_utils.write_file(self.path, self.file_name, content)
+        logging.info(f"Saved response cache {self.file_name}: entries:{len(self.entries)}, hits:{self.hits}, misses:{self.misses}")
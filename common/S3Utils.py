@@ -1,7 +1,13 @@
 import boto3
 from botocore.exceptions import ClientError
+from contextlib import closing, contextmanager
 import logging
 import os
+import time
+import uuid
+
+from common.Compression import Compression
+from common.JSONMixin import JSONMixin
 
 
 # S3 Utils class for handling S3 operations
@@ -9,6 +15,8 @@ class S3Utils:
     def __init__(self, bucket_name):
         self.s3_client = boto3.client('s3')
         self.bucket_name = bucket_name
+        # prefix -> keys directly under it, see snapshot()
+        self.snapshots = {}
 
     def list(self, s3_path):
         keys = []
@@ -17,12 +25,43 @@ class S3Utils:
         pages = paginator.paginate(Bucket=self.bucket_name, Prefix=s3_path)
 
         for page in pages:
-            for obj in page['Contents']:
+            for obj in page.get('Contents', []):
                 keys.append(obj['Key'].replace(s3_path+"/", ''))
 
         return keys
 
+    def snapshot(self, s3_path):
+        """
+        Lists the prefix once and keeps its keys in memory: file_exists answers from the snapshot
+        instead of a HEAD request per file, and the writes done through this object keep it current
+        """
+        prefix = os.path.normpath(s3_path)
+        keys = self.__list_keys(prefix + "/")
+        self.snapshots[prefix] = {key for key in keys if os.path.dirname(key) == prefix}
+        logging.info(f"Snapshot of {prefix}: {len(self.snapshots[prefix])} files")
+        return len(self.snapshots[prefix])
+
+    def _snapshot_contains(self, key):
+        """
+        True/False when the key's prefix has a snapshot, None when it has to be checked remotely
+        """
+        keys = self.snapshots.get(os.path.dirname(os.path.normpath(key)))
+        return None if keys is None else os.path.normpath(key) in keys
+
+    def _snapshot_add(self, key):
+        keys = self.snapshots.get(os.path.dirname(os.path.normpath(key)))
+        if keys is not None:
+            keys.add(os.path.normpath(key))
+
+    def _snapshot_discard(self, key):
+        keys = self.snapshots.get(os.path.dirname(os.path.normpath(key)))
+        if keys is not None:
+            keys.discard(os.path.normpath(key))
+
     def file_exists(self, s3_path, file_name):
+        exists = self._snapshot_contains(os.path.join(s3_path, file_name))
+        if exists is not None:
+            return exists
         try:
             key = os.path.join(s3_path, file_name)
             self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
@@ -31,9 +70,38 @@ class S3Utils:
             return False
 
     def read_file(self, s3_path, file_name):
+        with self.open_object(s3_path, file_name) as body:
+            return body.read().decode('utf-8')
+
+    @contextmanager
+    def open_object(self, s3_path, file_name):
+        """
+        Binary file-like body of the object, read as it streams from S3 (no staging in /tmp).
+        gzip/zstd objects (key suffix or ContentEncoding) are decompressed while they are read.
+        """
         key = os.path.join(s3_path, file_name)
         obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
-        return obj['Body'].read().decode('utf-8')
+        encoding = Compression.encoding_for(key)
+        if encoding is None and obj.get('ContentEncoding') in Compression.suffixes.values():
+            encoding = obj['ContentEncoding']
+        with closing(obj['Body']) as body, closing(Compression.open_stream(body, encoding)) as stream:
+            yield stream
+
+    def read_range(self, s3_path, file_name, start, length):
+        """
+        length bytes of the (uncompressed) object from start, with a ranged GET
+        """
+        key = os.path.join(s3_path, file_name)
+        obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{start + length - 1}")
+        with closing(obj['Body']) as body:
+            return body.read()
+
+    def read_json(self, s3_path, file_name):
+        """
+        Object parsed straight from the streamed body
+        """
+        with self.open_object(s3_path, file_name) as body:
+            return JSONMixin.json_load(body)
 
     def upload_object(self, file_name, s3_path):
         try:
@@ -41,6 +109,7 @@ class S3Utils:
         except ClientError as e:
             logging.error(e)
             return False
+        self._snapshot_add(s3_path)
         return True
 
     def download_object(self, s3_path, file_name):
@@ -52,19 +121,87 @@ class S3Utils:
             return False
         return True
 
-    def write_file(self, s3_path, file_name, content):
+    def write_file(self, s3_path, file_name, content, encoding=None):
+        """
+        encoding (gzip/zstd, or implied by a .gz/.zst key suffix) compresses the content,
+        the object keeps it as ContentEncoding so readers decompress it transparently
+        """
         try:
             key = os.path.join(s3_path, file_name)
-            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=content)
+            encoding = encoding or Compression.encoding_for(key)
+            if encoding:
+                self.s3_client.put_object(Bucket=self.bucket_name, Key=key, ContentEncoding=encoding,
+                                          Body=Compression.compress(content, encoding))
+            else:
+                self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=content)
         except ClientError as e:
             logging.error(e)
             return False
+        self._snapshot_add(key)
         return True
 
+    @staticmethod
+    def segments_path(s3_path, file_name):
+        return os.path.join(s3_path, f"{file_name}.segments")
+
+    def __list_keys(self, prefix):
+        keys = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                keys.append(obj['Key'])
+        return keys
+
     def append_to_file(self, s3_path, file_name, content):
+        """
+        Appends by writing the content as a new immutable segment next to the file
+        ({file_name}.segments/<time>_<id>.seg), no read-modify-write of the whole object.
+        read_segmented_file gives the merged view, compact_segments folds the segments back in.
+        """
+        if not content:
+            return True
+        segment = f"{time.time_ns():020d}_{uuid.uuid4().hex[:8]}.seg"
+        return self.write_file(self.segments_path(s3_path, file_name), segment, content)
+
+    def __segment_keys(self, s3_path, file_name):
+        # segment names start with a zero padded timestamp, key order is append order
+        return sorted(self.__list_keys(self.segments_path(s3_path, file_name) + "/"))
+
+    def read_segmented_file(self, s3_path, file_name):
+        """
+        Content of the file followed by all its appended segments, "" when none exist
+        """
+        return self.__merge_segments(s3_path, file_name, self.__segment_keys(s3_path, file_name))
+
+    def __merge_segments(self, s3_path, file_name, segment_keys):
+        parts = []
+        if self.file_exists(s3_path, file_name):
+            parts.append(self.read_file(s3_path, file_name))
+        for key in segment_keys:
+            parts.append(self.read_file("", key))
+        return "\n".join(part.rstrip("\n") for part in parts if part)
+
+    def compact_segments(self, s3_path, file_name):
+        """
+        Folds the current segments into the file itself and deletes them,
+        segments appended meanwhile are left for the next compaction
+        """
+        segment_keys = self.__segment_keys(s3_path, file_name)
+        if not segment_keys:
+            return 0
+        if not self.write_file(s3_path, file_name, self.__merge_segments(s3_path, file_name, segment_keys)):
+            return 0
+        for key in segment_keys:
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+        logging.info(f"Compacted {len(segment_keys)} segments into {os.path.join(s3_path, file_name)}")
+        return len(segment_keys)
+
+    def delete_file(self, s3_path, file_name):
         try:
-            content_old = self.read_file(s3_path, file_name)
-            content_old = content_old + "\n"
+            key = os.path.join(s3_path, file_name)
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
         except ClientError as e:
-            content_old = ""
-        self.write_file(s3_path, file_name, content_old+content)
+            logging.error(e)
+            return False
+        self._snapshot_discard(key)
+        return True
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from common.JSONMixin import JSONMixin
+
+
+class ShardStore:
+    """
+    Packs many per store artifacts (e.g. menus) into shared shard objects instead of one object per store.
+
+    A shard is a JSONL object <time>_<id>.jsonl, one {"id": ..., "data": ...} record per line, written
+    with an index object <time>_<id>.index.json: id -> [byte offset, length] of its line. Readers load
+    the indexes (one listing + one small GET per shard) and then either read a single record with a
+    ranged GET or a whole shard at once. An id written again in a later shard replaces the earlier one.
+
+        store = ShardStore(file_utils, "menu-shards/2025062/imtiaz")
+        store.add("114.json", menu_data)      # buffered, written every shard_size records
+        store.flush()
+        store.load_index()
+        store.read("114.json")
+    """
+    index_suffix = ".index.json"
+
+    def __init__(self, file_utils, path, shard_size=100, cache_shards=2):
+        self.file_utils = file_utils
+        self.path = path
+        self.shard_size = shard_size
+        self.cache_shards = cache_shards
+        self.index = {}
+        self.pending = []
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __contains__(self, record_id):
+        return record_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def load_index(self):
+        """
+        Reads the index of every shard under the path, returns the number of records
+        """
+        self.index = {}
+        try:
+            names = self.file_utils.list(self.path + "/")
+        except FileNotFoundError:
+            names = []
+        # shard names start with a zero padded timestamp, later shards win
+        shards = sorted(os.path.basename(name)[:-len(self.index_suffix)]
+                        for name in names if name.endswith(self.index_suffix))
+        for shard in shards:
+            shard_index = self.file_utils.read_json(self.path, shard + self.index_suffix)
+            for record_id, (start, length) in shard_index.items():
+                self.index[record_id] = (shard, start, length)
+        logging.info(f"[shards] Loaded {len(self.index)} records from {len(shards)} shards of {self.path}")
+        return len(self.index)
+
+    def ids(self):
+        """
+        Record ids in storage order (shard, then position), consecutive ids mostly share a shard
+        """
+        return sorted(self.index, key=lambda record_id: self.index[record_id][:2])
+
+    def read(self, record_id):
+        """
+        One record, from a cached shard when available, with a ranged read otherwise
+        """
+        shard, start, length = self.index[record_id]
+        with self.__lock:
+            records = self.__cache.get(shard)
+        if records is not None:
+            return records[record_id]
+        return JSONMixin.json_loads(self.file_utils.read_range(self.path, shard + ".jsonl", start, length))["data"]
+
+    def read_cached(self, record_id):
+        """
+        One record, loading its whole shard (one GET) and keeping the last cache_shards shards,
+        for sequential readers that go through most records of a shard
+        """
+        shard = self.index[record_id][0]
+        with self.__lock:
+            records = self.__cache.get(shard)
+            if records is None:
+                records = {}
+                content = self.file_utils.read_file(self.path, shard + ".jsonl")
+                for line in content.splitlines():
+                    if line:
+                        record = JSONMixin.json_loads(line)
+                        records[record["id"]] = record["data"]
+                self.__cache[shard] = records
+                while len(self.__cache) > self.cache_shards:
+                    self.__cache.popitem(last=False)
+            self.__cache.move_to_end(shard)
+        return records[record_id]
+
+    def add(self, record_id, data):
+        """
+        Buffers a record, a shard is written every shard_size records
+        """
+        self.pending.append((record_id, data))
+        if len(self.pending) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return None
+        shard = f"{time.time_ns():020d}_{uuid.uuid4().hex[:8]}"
+        lines = []
+        shard_index = {}
+        start = 0
+        for record_id, data in self.pending:
+            line = (JSONMixin.json_dumps({"id": record_id, "data": data}) + "\n").encode('utf-8')
+            shard_index[record_id] = [start, len(line)]
+            lines.append(line)
+            start += len(line)
+
+        # the index goes last, a shard without index is never read
+        self.file_utils.write_file(self.path, shard + ".jsonl", b"".join(lines).decode('utf-8'))
+        self.file_utils.write_file(self.path, shard + self.index_suffix, JSONMixin.json_dumps(shard_index))
+        for record_id, (start, length) in shard_index.items():
+            self.index[record_id] = (shard, start, length)
+        logging.info(f"[shards] Wrote shard {shard} with {len(self.pending)} records to {self.path}")
+        self.pending = []
+        return shard
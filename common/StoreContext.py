@@ -0,0 +1,23 @@
+from operator import itemgetter
+
+
+class StoreContext:
+    """
+    Store columns of the CSV rows (address, coordinates, CBSA, brand, date...), computed once per
+    store by BaseJsonToCsv.store_context instead of once per product. row_suffix holds them in
+    csv_headers() order, ready to be appended to the item columns of every row; order puts such
+    a row (item_columns + row_suffix) into csv_headers() order, None when it already is.
+    """
+    def __init__(self, values, headers, item_columns):
+        self.values = values
+        store_columns = [column for column in headers if column not in item_columns]
+        # like DictWriter, a header without a value is written empty
+        self.row_suffix = tuple(values.get(column, "") for column in store_columns)
+        layout = list(item_columns) + store_columns
+        if list(headers) == layout:
+            self.order = None
+        else:
+            self.order = itemgetter(*(layout.index(column) for column in headers))
+
+    def __getitem__(self, column):
+        return self.values[column]
@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+# names and descriptions repeat across every branch of a chain, most lookups are hits
+CACHE_SIZE = 65536
+
+
+class TextNormalizer:
+    """
+    Cleaning of menu names and descriptions with str.translate tables, memoized per raw string.
+    Gives exactly the results of the former regex based rules of BaseJsonToCsv:
+
+        clean_text: strip, newlines and commas to spaces, whitespace runs to a single space
+        clean_name: ™ and ® removed, strip, lower case (None when not a string)
+    """
+    text_table = str.maketrans({',': ' '})
+    name_table = str.maketrans({'™': None, '®': None})
+
+    @staticmethod
+    def clean_text(text):
+        if not isinstance(text, str):
+            return text
+        return TextNormalizer.__clean_text(text)
+
+    @staticmethod
+    def clean_name(text):
+        if not isinstance(text, str):
+            return None
+        return TextNormalizer.__clean_name(text)
+
+    @staticmethod
+    def clean_texts(texts):
+        """
+        clean_text of a whole list, e.g. the descriptions of a menu
+        """
+        return [TextNormalizer.clean_text(text) for text in texts]
+
+    @staticmethod
+    def clean_names(texts):
+        return [TextNormalizer.clean_name(text) for text in texts]
+
+    @staticmethod
+    def cache_clear():
+        TextNormalizer.__clean_text.cache_clear()
+        TextNormalizer.__clean_name.cache_clear()
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def __clean_text(text):
+        # \n and \r are whitespace, only the commas need to be turned into spaces before collapsing
+        text = text.strip().translate(TextNormalizer.text_table)
+        if not text:
+            return text
+        collapsed = " ".join(text.split())
+        if not collapsed:
+            return " "
+        # a comma at either end became a space that the collapse keeps as one space
+        if text[0].isspace():
+            collapsed = " " + collapsed
+        if text[-1].isspace():
+            collapsed = collapsed + " "
+        return collapsed
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def __clean_name(text):
+        return text.translate(TextNormalizer.name_table).strip().lower()
@@ -0,0 +1,77 @@
+"""
+Build data/cbsa_polygons.json, the CBSA geometries used by CbsaIndex for the exact point in
+polygon test, from the Census cartographic boundary file of the CBSAs.
+
+    # https://www2.census.gov/geo/tiger/GENZ2023/shp/cb_2023_us_cbsa_500k.zip
+    python generate_cbsa_polygons.py cb_2023_us_cbsa_500k.zip
+    python generate_cbsa_polygons.py cbsa.geojson --precision 4
+
+Shapefiles (.shp or the zipped download) need the pyshp package, GeoJSON input (e.g. converted
+with ogr2ogr) is read as is. Only the GEOID of every feature is kept, coordinates are rounded to
+--precision decimals, and CBSAs of cbsa_bounding_boxes.json without a geometry are reported
+(they keep the bounding box answer). makeLambda.sh ships the file when it exists.
+"""
+import argparse
+import json
+import os
+
+try:
+    import shapefile
+except ImportError:
+    shapefile = None
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def read_features(source):
+    if source.endswith((".json", ".geojson")):
+        with open(source, encoding="utf-8") as file:
+            return json.load(file).get("features", [])
+    if shapefile is None:
+        raise SystemExit("Reading shapefiles needs the pyshp package (pip install pyshp), or convert to GeoJSON first")
+    with shapefile.Reader(source) as reader:
+        return [{"properties": record.record.as_dict(), "geometry": record.shape.__geo_interface__}
+                for record in reader.iterShapeRecords()]
+
+
+def round_coordinates(coordinates, precision):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, precision) for value in coordinates]
+    return [round_coordinates(part, precision) for part in coordinates]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="CBSA shapefile (.shp / .zip) or GeoJSON")
+    parser.add_argument("--output", default=os.path.join(DATA_PATH, "cbsa_polygons.json"))
+    parser.add_argument("--boxes", default=os.path.join(DATA_PATH, "cbsa_bounding_boxes.json"),
+                        help="bounding boxes the geometries are checked against")
+    parser.add_argument("--precision", type=int, default=5, help="decimals kept, 5 is about 1m")
+    args = parser.parse_args()
+
+    features = []
+    for feature in read_features(args.source):
+        properties = feature.get("properties") or {}
+        geometry = feature.get("geometry") or {}
+        geoid = properties.get("GEOID") or properties.get("CBSAFP")
+        if geoid is None or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+            continue
+        features.append({"type": "Feature", "properties": {"GEOID": str(geoid)},
+                         "geometry": {"type": geometry["type"],
+                                      "coordinates": round_coordinates(geometry["coordinates"], args.precision)}})
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": features}, file, separators=(",", ":"))
+    print(f"Wrote {len(features)} CBSA geometries to {args.output}")
+
+    if os.path.exists(args.boxes):
+        with open(args.boxes, encoding="utf-8") as file:
+            box_geoids = {str(box["GEOID"]) for box in json.load(file)}
+        missing = sorted(box_geoids - {feature["properties"]["GEOID"] for feature in features})
+        if missing:
+            print(f"{len(missing)} CBSAs of {args.boxes} have no geometry: {', '.join(missing[:20])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,45 +33,32 @@ class ImtiazJsonToCsv(BaseJsonToCsv):
                 logging.warning(f"[{self.get_service_name()}] No products found for store_id: {store_id}")
                 return
             
-            # Process each product
+            # Store columns are computed once, the rows are written as the products are read
+            rows = self.gen_csv_rows(self.__menu_items(products), self.store_context(store))
             total_items = 0
-            for product in products:
-                try:
-                    menu_id = str(product.get('id', 'N/A'))
-                    menu_name = product.get('name', 'N/A')
-                    menu_description = product.get('desc', '')
-                    
-                    # Handle price conversion safely
-                    try:
-                        price = float(product.get('price', 0))
-                    except (ValueError, TypeError):
-                        price = 0.0
-                    
-                    # Use sub-section as parent category
-                    sub_section_name = product.get('sub_section_name', 'N/A')
-                    sub_section_id = product.get('sub_section_id', 'N/A')
-                    
-                    # Generate CSV row using base class method
-                    row = self.gen_csv_row(
-                        menu_name=menu_name,
-                        menu_description=menu_description,
-                        price=price,
-                        menu_id=menu_id,
-                        menu_parent_id=sub_section_id,
-                        menu_parent_name=sub_section_name,
-                        store=store
-                    )
-                    
-                    # Write row to CSV
-                    if writer:
-                        writer.writerow(row)
-                        total_items += 1
-                
-                except Exception as e:
-                    logging.error(f"[{self.get_service_name()}] Error processing product {product.get('id', 'unknown')}: {str(e)}")
-                    continue
+            if writer:
+                total_items = self.write_rows(writer, rows)
             
             logging.info(f"[{self.get_service_name()}] Successfully wrote {total_items} items for store_id: {store_id}")
         
         except Exception as e:
-            logging.error(f"[{self.get_service_name()}] Error writing menu to CSV for store_id {store_id}: {str(e)}")
\ No newline at end of file
+            logging.error(f"[{self.get_service_name()}] Error writing menu to CSV for store_id {store_id}: {str(e)}")
+
+    def __menu_items(self, products):
+        """
+        (menu_name, menu_description, price, menu_id, menu_parent_id, menu_parent_name) of each product
+        """
+        for product in products:
+            try:
+                # Handle price conversion safely
+                try:
+                    price = float(product.get('price', 0))
+                except (ValueError, TypeError):
+                    price = 0.0
+
+                # Use sub-section as parent category
+                yield (product.get('name', 'N/A'), product.get('desc', ''), price, str(product.get('id', 'N/A')),
+                       product.get('sub_section_id', 'N/A'), product.get('sub_section_name', 'N/A'))
+            except Exception as e:
+                logging.error(f"[{self.get_service_name()}] Error processing product {product.get('id', 'unknown')}: {str(e)}")
+                continue
@@ -1,14 +1,18 @@
-import json
 import logging
 import os
 
 from common.BaseLocation import BaseLocation
 from common.ParserName import ParserName
+from imtiaz import RATE_LIMIT
 
 
 class ImtiazLocation(BaseLocation):
+    rate_limit = RATE_LIMIT
+
     def __init__(self, event, context):
         super().__init__(event, str(os.path.dirname(__file__)), context)
+        # can point to a local stub of the site, see benchmarks/stub_server.py
+        self.base_url = event.get("base_url", "https://shop.imtiaz.com.pk")
 
     def get_service_name(self):
         return ParserName.imtiaz.name
@@ -27,7 +31,7 @@ class ImtiazLocation(BaseLocation):
         """
         Fetch all Imtiaz locations from geofence API
         """
-        url = "https://shop.imtiaz.com.pk/api/geofence"
+        url = f"{self.base_url}/api/geofence"
         query_params = {'restId': '55126'}
         
         return self.get_request(url, self.__get_headers(), query_params, False)
@@ -119,7 +123,7 @@ class ImtiazLocation(BaseLocation):
                 # Check if file already exists to avoid duplicate work
                 if not self.file_utils.file_exists(self.output_file_path, j_filename):
                     logging.info(f"[{self.get_service_name()}] Saving geofence file: {j_filename} (rest_brId: {geofence.get('rest_brId')}, area: {geofence.get('area_name')})")
-                    self.file_utils.write_file(self.output_file_path, j_filename, json.dumps(location_data))
+                    self.file_utils.write_file(self.output_file_path, j_filename, self.json_dumps(location_data))
                     total_geofences += 1
                 else:
                     content = f"file,{j_filename},found,success"
@@ -2,15 +2,24 @@ import json
 import logging
 import os
 from datetime import datetime
-from time import sleep
+from urllib.parse import urlparse
 
 from common.BaseMenu import BaseMenu
+from common.CbsaIndex import CbsaIndex
 from common.ParserName import ParserName
+from imtiaz import RATE_LIMIT
 
 
 class ImtiazMenu(BaseMenu):
+    rate_limit = RATE_LIMIT
+
     def __init__(self, event, context):
         super().__init__(event, str(os.path.dirname(__file__)), context)
+        # can point to a local stub of the site, see benchmarks/stub_server.py
+        self.base_url = event.get("base_url", "https://shop.imtiaz.com.pk")
+        self.host = urlparse(self.base_url).netloc
+        if "cbsa_path" not in event:
+            self.cbsa_path_json = os.path.join(os.path.dirname(__file__), "..", "..", "data", "cbsa_bounding_boxes.json")
 
     def get_service_name(self):
         return ParserName.imtiaz.name
@@ -28,6 +37,10 @@ class ImtiazMenu(BaseMenu):
     def get_store_id(self, params):
         return params.get('rest_brId', 'N/A')
 
+    def get_fetch_key(self, store_data):
+        # many geofences are served by the same branch catalog
+        return store_data.get('rest_brId')
+
     def parse_location_for_menu(self, item_details_json, filename):
         return item_details_json
 
@@ -72,54 +85,81 @@ class ImtiazMenu(BaseMenu):
             logging.error(f"[{self.get_service_name()}] No menu sections found")
             return None
         
-        all_products = []
-        
+        sections = []
         for menu_section in menu_sections:
             menu_id = menu_section.get('id')
             menu_name = menu_section.get('name', 'Unknown')
             
             # Get sections within this menu
-            sections = menu_section.get('section', [])
+            for section in menu_section.get('section', []):
+                sections.append((menu_id, menu_name, section.get('id'), section.get('name', 'Unknown')))
+        
+        # Sub-sections and their products are fetched concurrently, results keep the website order
+        return self.crawl_engine.run(self.__crawl_sections(rest_brId, menu_sections, sections))
+
+    async def __crawl_sections(self, rest_brId, menu_sections, sections):
+        """
+        Fan out: sub-sections of every section, then products of every sub-section
+        """
+        for menu_id, menu_name, section_id, section_name in sections:
+            logging.info(f"[{self.get_service_name()}] Processing section: {section_name} (ID: {section_id})")
+        
+        # Get sub-sections for every section
+        sub_sections_list = await self.__fetch_section_tree(rest_brId, menu_sections, sections)
+        
+        jobs = []
+        for section, sub_sections in zip(sections, sub_sections_list):
+            for sub_section in sub_sections:
+                sub_section_id = sub_section.get('id')
+                sub_section_name = sub_section.get('name', 'Unknown')
+                logging.info(f"[{self.get_service_name()}] Processing sub-section: {sub_section_name} (ID: {sub_section_id})")
+                jobs.append((section, sub_section_id, sub_section_name))
+        
+        # Get products for every sub-section, pacing is done by the rate limiter
+        products_list = await self.crawl_engine.map(
+            self.host, self.__fetch_sub_section_products, [(rest_brId, job[1]) for job in jobs])
+        
+        all_products = []
+        for (section, sub_section_id, sub_section_name), products in zip(jobs, products_list):
+            menu_id, menu_name, section_id, section_name = section
+            # Add category hierarchy info to products
+            for product in products:
+                product['menu_id'] = menu_id
+                product['menu_name'] = menu_name
+                product['section_id'] = section_id
+                product['section_name'] = section_name
+                product['sub_section_id'] = sub_section_id
+                product['sub_section_name'] = sub_section_name
             
-            for section in sections:
-                section_id = section.get('id')
-                section_name = section.get('name', 'Unknown')
-                
-                logging.info(f"[{self.get_service_name()}] Processing section: {section_name} (ID: {section_id})")
-                
-                # Get sub-sections for this section
-                sub_sections = self.__fetch_sub_sections(rest_brId, section_id)
-                
-                for sub_section in sub_sections:
-                    sub_section_id = sub_section.get('id')
-                    sub_section_name = sub_section.get('name', 'Unknown')
-                    
-                    logging.info(f"[{self.get_service_name()}] Processing sub-section: {sub_section_name} (ID: {sub_section_id})")
-                    
-                    # Get products for this sub-section
-                    products = self.__fetch_sub_section_products(rest_brId, sub_section_id)
-                    
-                    # Add category hierarchy info to products
-                    for product in products:
-                        product['menu_id'] = menu_id
-                        product['menu_name'] = menu_name
-                        product['section_id'] = section_id
-                        product['section_name'] = section_name
-                        product['sub_section_id'] = sub_section_id
-                        product['sub_section_name'] = sub_section_name
-                    
-                    all_products.extend(products)
-                    
-                    # Add delay to avoid rate limiting
-                    sleep(0.5)
+            all_products.extend(products)
         
         return all_products
 
+    async def __fetch_section_tree(self, rest_brId, menu_sections, sections):
+        """
+        Sub-sections of every section. The tree is shared by the branches of the restaurant: a branch
+        whose menu sections hash the same as those the cached tree was built from reuses it, any
+        other branch fetches its own and replaces the cached one.
+        """
+        cache_key = self.response_cache.make_key(f"{self.base_url}/api/sub-section", {'restId': '55126'})
+        tree_hash = self.response_cache.content_hash(menu_sections)
+        sub_sections_list = self.response_cache.get(cache_key, tree_hash)
+        if sub_sections_list is not None:
+            logging.info(f"[{self.get_service_name()}] Reusing sub-sections of {len(sub_sections_list)} sections (cached category tree)")
+            return sub_sections_list
+        
+        sub_sections_list = await self.crawl_engine.map(
+            self.host, self.__fetch_sub_sections, [(rest_brId, section[2]) for section in sections])
+        # a tree with failed sections is not shared
+        if all(sub_sections is not None for sub_sections in sub_sections_list):
+            self.response_cache.put(cache_key, sub_sections_list, tree_hash)
+        return [sub_sections or [] for sub_sections in sub_sections_list]
+
     def __fetch_menu_sections(self, rest_brId):
         """
         Fetch menu sections (categories)
         """
-        url = "https://shop.imtiaz.com.pk/api/menu-section"
+        url = f"{self.base_url}/api/menu-section"
         
         params = {
             'restId': '55126',
@@ -149,9 +189,9 @@ class ImtiazMenu(BaseMenu):
 
     def __fetch_sub_sections(self, rest_brId, section_id):
         """
-        Fetch sub-sections for a given section
+        Fetch sub-sections for a given section, None when the call failed
         """
-        url = "https://shop.imtiaz.com.pk/api/sub-section"
+        url = f"{self.base_url}/api/sub-section"
         
         params = {
             'restId': '55126',
@@ -174,19 +214,20 @@ class ImtiazMenu(BaseMenu):
                         return sub_sections
                 else:
                     logging.debug(f"[{self.get_service_name()}] Sub-sections API returned status: {data.get('status')} for section {section_id}")
+                return []
             else:
                 logging.debug(f"[{self.get_service_name()}] Sub-sections API failed for section {section_id}")
                 
         except Exception as e:
             logging.debug(f"[{self.get_service_name()}] Error fetching sub-sections for section {section_id}: {str(e)}")
         
-        return []
+        return None
 
     def __fetch_sub_section_products(self, rest_brId, sub_section_id, page_no=1, per_page=100):
         """
         Fetch products for a specific sub-section (this is the working endpoint!)
         """
-        url = "https://shop.imtiaz.com.pk/api/items-by-subsection"
+        url = f"{self.base_url}/api/items-by-subsection"
         
         params = {
             'restId': '55126',
@@ -239,20 +280,22 @@ class ImtiazMenu(BaseMenu):
         
         return ResponseObject(data)
 
+    def cbsa_index(self):
+        """
+        Override to handle CBSA path correctly
+        """
+        if os.path.exists(self.cbsa_path_json):
+            return CbsaIndex.get(self.cbsa_path_json)
+        return None
+
     def find_cbsa(self, latitude, longitude):
         """
         Override to handle CBSA path correctly
         """
         try:
-            parser_dir = os.path.dirname(__file__)
-            cbsa_path = os.path.join(parser_dir, "..", "..", "data", "cbsa_bounding_boxes.json")
-            
-            if os.path.exists(cbsa_path):
-                cbsa_data = self.read_from_json_file(cbsa_path)
-                for cbsa in cbsa_data:
-                    if (cbsa['min_lat'] <= float(latitude) <= cbsa['max_lat'] and
-                            cbsa['min_lon'] <= float(longitude) <= cbsa['max_lon']):
-                        return cbsa
+            cbsa_index = self.cbsa_index()
+            if cbsa_index is not None:
+                return cbsa_index.lookup(latitude, longitude)
         except Exception as e:
             logging.debug(f"[{self.get_service_name()}] Error finding CBSA: {str(e)}")
         
@@ -0,0 +1,2 @@
+# requests/sec per host of the Imtiaz parsers, see RateLimiter.from_config
+RATE_LIMIT = {"shop.imtiaz.com.pk": 4, "default": 2}
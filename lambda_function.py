@@ -46,8 +46,8 @@ from common.ParserName import ParserName
 # from solid_core.SolidCoreJSONToCSV import SolidCoreJSONToCSV
 from common.ProcessLogs import ProcessLogs
 from imtiaz.ImtiazLocation import ImtiazLocation
-# from imtiaz.ImtiazMenu import ImtiazMenu
-# from imtiaz.ImtiazJsonToCsv import ImtiazJsonToCsv
+from imtiaz.ImtiazMenu import ImtiazMenu
+from imtiaz.ImtiazJsonToCsv import ImtiazJsonToCsv
 # from metro.MetroLocation import MetroLocation
 # from metro.MetroMenu import MetroMenu
 # from metro.MetroJsonToCsv import MetroJsonToCsv
@@ -74,6 +74,8 @@ def lambda_handler(event, context):
     if parser is not None:
         if action == ActionName.PROCESS_LOCATION.value:
             response_event = parser.gen_location()
+        elif action == ActionName.PROCESS_CBSA.value:
+            response_event = parser.gen_cbsa_index()
         elif action == ActionName.PROCESS_MENU.value:
             response_event = parser.gen_menu()
         elif action == ActionName.PROCESS_POST_MENU.value:
@@ -99,8 +101,16 @@ def lambda_handler(event, context):
 def get_parser(action, parser, events, context):
     if action == ActionName.PROCESS_LOGS.value:
         return ProcessLogs(events, context)
+    if action == ActionName.PROCESS_CBSA.value:
+        # gen_cbsa_index is implemented by BaseMenu, every parser indexes with its menu class
+        return get_parser(ActionName.PROCESS_MENU.value, parser, events, context)
     if parser == ParserName.imtiaz.name:
-        return ImtiazLocation(events, context)
+        if action == ActionName.PROCESS_LOCATION.value:
+            return ImtiazLocation(events, context)
+        elif action == ActionName.PROCESS_MENU.value:
+            return ImtiazMenu(events, context)
+        elif action == ActionName.MAKE_CSV.value:
+            return ImtiazJsonToCsv(events, context)
   
     # if parser == ParserName.chickfila.name:
     #     if action == ActionName.PROCESS_LOCATION.value:
@@ -36,6 +36,8 @@ cp -r orange_theory/Orange* lambda/orange_theory
 cp -r common lambda/
 cp -r data/cbsa_bounding_boxes.json lambda/data/cbsa_bounding_boxes.json
 cp -r data/cbsa_db.csv lambda/data/cbsa_db.csv
+# exact CBSA polygons, built with generate_cbsa_polygons.py
+[ -f data/cbsa_polygons.json ] && cp data/cbsa_polygons.json lambda/data/cbsa_polygons.json
 cp  lambda_function.py lambda/
 echo removing extra files
 rm -rf lambda/common/__pycache__
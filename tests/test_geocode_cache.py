@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from common.GeocodeCache import GeocodeCache
+from common.LocalUtils import LocalUtils
+
+CACHE_FILE = "imtiaz_address_cache.csv"
+
+
+class DeleteHookUtils(LocalUtils):
+    """
+    LocalUtils running a callback before its first delete, i.e. between the read and the delete
+    of a compaction
+    """
+    def __init__(self, folder, before_delete):
+        super().__init__(folder)
+        self.before_delete = before_delete
+
+    def delete_file(self, local_path, file_name):
+        if self.before_delete is not None:
+            before_delete, self.before_delete = self.before_delete, None
+            before_delete()
+        return super().delete_file(local_path, file_name)
+
+
+class GeocodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="geocode_cache_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def worker(self, worker_id, file_utils=None):
+        return GeocodeCache(file_utils or LocalUtils(self.folder), "", CACHE_FILE, worker_id)
+
+    def shards(self):
+        delta_path = os.path.join(self.folder, "imtiaz_address_cache_delta")
+        return sorted(os.listdir(delta_path)) if os.path.isdir(delta_path) else []
+
+    def test_interleaved_flush_and_compact_keep_every_address(self):
+        worker_b = self.worker("b")
+        worker_a = self.worker("a", DeleteHookUtils(self.folder, None))
+
+        worker_a.put("a1", "1.0", "1.5")
+        worker_a.flush()
+        worker_b.put("b1", "2.0", "2.5")
+        worker_b.flush()
+        self.assertEqual(worker_a.compact(), 2)
+        self.assertEqual(self.shards(), [])
+
+        # b keeps geocoding after the compaction, and flushes again in the middle of the next one
+        worker_b.put("b2", "3.0", "3.5")
+        worker_b.flush()
+        worker_a.put("a2", "4.0", "4.5")
+
+        def flush_b():
+            worker_b.put("b3", "5.0", "5.5")
+            worker_b.flush()
+
+        worker_a.file_utils.before_delete = flush_b
+        worker_a.compact()
+        self.assertEqual(self.shards(), ["b_0003.csv"])
+
+        reader = self.worker("reader")
+        for address, lat, long in [("a1", "1.0", "1.5"), ("a2", "4.0", "4.5"), ("b1", "2.0", "2.5"),
+                                   ("b2", "3.0", "3.5"), ("b3", "5.0", "5.5")]:
+            self.assertEqual(reader.get(address), (lat, long))
+
+        self.assertEqual(self.worker("last").compact(), 1)
+        self.assertEqual(self.shards(), [])
+        self.assertEqual(self.worker("check").get("b3"), ("5.0", "5.5"))
+
+    def test_every_flush_writes_a_new_shard(self):
+        worker = self.worker("w")
+        worker.put("x", "1.0", "1.0")
+        worker.flush()
+        worker.put("y", "2.0", "2.0")
+        worker.flush()
+        self.assertFalse(worker.flush())
+        self.assertEqual(self.shards(), ["w_0001.csv", "w_0002.csv"])
+
+        reader = self.worker("reader")
+        self.assertEqual(reader.get("x"), ("1.0", "1.0"))
+        self.assertEqual(reader.get("y"), ("2.0", "2.0"))
+        self.assertIsNone(reader.get("z"))
+
+
+if __name__ == '__main__':
+    unittest.main()
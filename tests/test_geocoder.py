@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import Counter
+
+from common.GeocodeCache import GeocodeCache
+from common.Geocoder import Geocoder
+from common.LocalUtils import LocalUtils
+from imtiaz.ImtiazJsonToCsv import ImtiazJsonToCsv
+
+CBSA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures", "cbsa")
+
+
+class StubLocationClient:
+    """
+    Local stand-in for the Amazon Location client, answers search_place_index_for_text from a dict
+    address -> (lat, long) and counts the calls per address
+    """
+    def __init__(self, places):
+        self.places = places
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def search_place_index_for_text(self, IndexName, Text):
+        with self.lock:
+            self.calls[Text] += 1
+        if Text not in self.places:
+            return {'Results': []}
+        lat, long = self.places[Text]
+        # Amazon Location returns [longitude, latitude]
+        return {'Results': [{'Place': {'Geometry': {'Point': [long, lat]}}}]}
+
+
+class GeocoderTest(unittest.TestCase):
+    places = {"1 main st": (24.86, 67.01), "2 mall rd": (31.55, 74.34)}
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="geocoder_")
+        self.cache = GeocodeCache(LocalUtils(self.folder), "", "imtiaz_address_cache.csv", "test")
+        self.client = StubLocationClient(self.places)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_resolve_many_geocodes_distinct_addresses_once(self):
+        geocoder = Geocoder(self.cache, self.client, max_workers=4, rate_per_sec=0)
+        addresses = ["1 main st", "2 mall rd", "1 main st", "nowhere", "2 mall rd", "nowhere"]
+
+        resolved = geocoder.resolve_many(addresses)
+
+        self.assertEqual(self.client.calls, Counter({"1 main st": 1, "2 mall rd": 1, "nowhere": 1}))
+        self.assertEqual(resolved, {"1 main st": (24.86, 67.01), "2 mall rd": (31.55, 74.34),
+                                    "nowhere": (None, None)})
+        self.assertEqual(self.cache.get("1 main st"), (24.86, 67.01))
+        self.assertEqual(self.cache.get("2 mall rd"), (31.55, 74.34))
+        # known addresses are persisted, the failed one only remembered for this run
+        self.assertEqual(set(self.cache.pending), {"1 main st", "2 mall rd"})
+
+        geocoder.resolve_many(addresses)
+        self.assertEqual(sum(self.client.calls.values()), 3)
+
+    def test_parser_geocodes_through_the_injected_client(self):
+        client = self.client
+        client.places["1 main st, karachi, sindh, 74000"] = (24.86, 67.01)
+
+        class StubJsonToCsv(ImtiazJsonToCsv):
+            def geocode_client(self):
+                return client
+
+        parser = StubJsonToCsv({"data_path": self.folder, "cbsa_path": CBSA_PATH, "geocode_rate": 0}, None)
+        store = {"address": "1 Main St", "city": "Karachi", "state": "Sindh", "zipcode": "74000"}
+        # the same store twice and one that already has coordinates
+        parser.prefetch_lat_long([store, dict(store), {"latitude": 24.9, "longitude": 67.1}])
+
+        self.assertEqual(client.calls, Counter({"1 main st, karachi, sindh, 74000": 1}))
+        self.assertEqual(parser.get_lat_long(parser.store_address(store)), (24.86, 67.01))
+        self.assertEqual(parser.store_context(store)['lat'], 24.86)
+        self.assertEqual(sum(client.calls.values()), 1)
+        self.assertTrue(parser.geocode_cache.dirty)
+
+if __name__ == '__main__':
+    unittest.main()